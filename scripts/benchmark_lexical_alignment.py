@@ -0,0 +1,324 @@
+import argparse
+import glob
+import json
+import os
+import random
+import sys
+import tracemalloc
+from contextlib import contextmanager
+from time import perf_counter
+import pandas as pd
+from src.consts import *
+from src.intermediate_io import intermediate_exists, read_intermediate
+from src.utils import load_dataset
+from src.lexical_alignment import lexical_edit_distance_attribution
+from src.lexical_alignment.edit_distance_utils import edit_distance
+from src.lexical_alignment.lemmatization import get_lemmatizer
+from src.lexical_alignment.lexical_edit_distance_attribution import EDIT_DISTANCE_ENGINES, lexical_alignment, lexical_alignment_recursively, word_tokenize_with_spans
+from src.lexical_alignment.tokenization import get_span_tokenizer
+
+"""
+Benchmark of the lexical alignment hot path (`src/lexical_alignment`).
+Replays the (sentence, fact) pairs of the saved results, plus synthetic pairs of increasing length built from the dataset documents,
+and reports the wall time, peak memory and DP cells per pair of `edit_distance`, `lexical_alignment` and `lexical_alignment_recursively`.
+
+The outputs are compared with a saved reference, so an optimization can't silently change the alignments.
+The committed references (results/test/lexical_alignment_reference__{mode}.json) hold the outputs of the original implementation
+(the full-matrix `edit_distance` and its traceback, and the lemmatization of each word with its own `nlp` call), together with the stop
+words they were generated with, which are then used instead of NLTK's so the comparison doesn't depend on the installed corpora.
+There are references for no lemmatization and for the "lookup" lemma backend. There is no reference for the "spacy" backend (the
+pipeline's default), since it depends on the installed en_core_web_sm version; generate one from a checkout known to be correct before
+changing that path:
+    python -m scripts.benchmark_lexical_alignment                                          # reports mismatches with the reference
+    python -m scripts.benchmark_lexical_alignment --lemma-backend lookup                   # same, with lemmatization
+    python -m scripts.benchmark_lexical_alignment --lemma-backend spacy --save-reference   # saves the outputs of the first engine
+"""
+
+ORIGINAL_EDIT_DISTANCE_ENGINE = "original"  # the full-matrix `edit_distance`, only for the edit distance benchmark (slow on long pairs)
+BENCHMARKED_FUNCTIONS = ["edit_distance", "lexical_alignment", "lexical_alignment_recursively"]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the lexical alignment")
+
+    parser.add_argument("--split", default="test", help="Dataset split to take the facts and documents from")
+    parser.add_argument("--engines", default=",".join(ALIGNMENT_ENGINES), help=f"Comma-separated list of alignment engines to benchmark (also accepts '{ORIGINAL_EDIT_DISTANCE_ENGINE}' for the edit distance)")
+    parser.add_argument("--functions", default=",".join(BENCHMARKED_FUNCTIONS), help="Comma-separated list of functions to benchmark")
+    parser.add_argument("--lemma-backend", default=None, choices=LEMMA_BACKENDS, help="Lemmatize the words with this backend (by default, no lemmatization)")
+    parser.add_argument("--anchored", action=argparse.BooleanOptionalAction, default=False, help="Whether to run the anchored alignment (may change the alignments)")
+    parser.add_argument("--synthetic-lengths", default="16,32,64,128,256,512", help="Comma-separated list of sentence lengths (in words) of the synthetic pairs")
+    parser.add_argument("--num-synthetic-pairs", type=int, default=5, help="Synthetic pairs per length and kind")
+    parser.add_argument("--reference-path", default=None, help="Where the reference outputs are saved (default: results/{split}/lexical_alignment_reference__{mode}.json)")
+    parser.add_argument("--save-reference", action=argparse.BooleanOptionalAction, default=False, help="Save the outputs of the first engine as the reference instead of comparing with it")
+    parser.add_argument("--output-path", default=None, help="Optional csv path to save the measurements to")
+
+    return parser.parse_args()
+
+
+def load_real_pairs(split: str):
+    """
+    The pairs aligned by the pipeline: facts with their sentence, and decontextualized facts with their sentence and with the entire output
+    """
+
+    technique_dirs = sorted(glob.glob(f"results/{split}/*/*/"))
+
+    pairs = []
+    for facts_path in [f"{technique_dir}{FACTS_IDENTIFIER}.csv" for technique_dir in technique_dirs]:
+        if not intermediate_exists(facts_path):
+            continue
+        facts_df = read_intermediate(facts_path)
+        pairs.extend({"source": "real_sentence", "sentence": row['sentence'], "fact": row['fact']} for _, row in facts_df.iterrows())
+    for facts_path in [f"{technique_dir}{DECONTEXTUALIZED_FACTS_IDENTIFIER}.csv" for technique_dir in technique_dirs]:
+        if not intermediate_exists(facts_path):
+            continue
+        facts_df = read_intermediate(facts_path)
+        pairs.extend({"source": "real_sentence", "sentence": row['sentence'], "fact": row['fact']} for _, row in facts_df.iterrows())
+        pairs.extend({"source": "real_context", "sentence": row['context'], "fact": row['fact']} for _, row in facts_df.iterrows())
+
+    return pairs
+
+
+def load_synthetic_pairs(split: str, lengths, num_pairs: int):
+    """
+    Windows of the dataset documents as sentences, with a noisy copy of the window ("synthetic_sentence", both texts grow)
+    or of a short part of it ("synthetic_context", a fact and a growing context) as facts. The pairs are deterministic.
+    """
+
+    words = []
+    for task in [MDS_TASK, LFQA_TASK]:
+        for topic_documents in load_dataset(TASK_TO_DATASET[task], split).values():
+            for document in topic_documents.values():
+                words.extend(document.split())
+
+    def noisy_copy(rng, window):
+        fact_words = [word for word in window if rng.random() < 0.7]
+        for _ in range(max(1, len(window) // 10)):
+            fact_words.insert(rng.randrange(len(fact_words) + 1), rng.choice(words))
+        return ' '.join(fact_words)
+
+    pairs = []
+    for length in lengths:
+        for pair_idx in range(num_pairs):
+            rng = random.Random(length * 1000 + pair_idx)
+            start = rng.randrange(len(words) - length)
+            window = words[start:start + length]
+            pairs.append({"source": f"synthetic_sentence_{length}", "sentence": ' '.join(window), "fact": noisy_copy(rng, window)})
+
+            fact_start = rng.randrange(max(1, length - 12))
+            pairs.append({"source": f"synthetic_context_{length}", "sentence": ' '.join(window), "fact": noisy_copy(rng, window[fact_start:fact_start + 12])})
+
+    return pairs
+
+
+def reset_caches(lemmatizer):
+    get_span_tokenizer().cache.clear()
+    if lemmatizer is not None:
+        lemmatizer.cache.clear()
+
+
+@contextmanager
+def count_dp_cells(engine: str, counter: list):
+    """
+    Counts the cells of the DPs run by `lexical_alignment` (including each region of the anchored alignment)
+    """
+
+    path_engines = lexical_edit_distance_attribution.EDIT_DISTANCE_PATH_ENGINES
+    edit_distance_path_func = path_engines[engine]
+
+    def counting_edit_distance_path_func(s1, s2):
+        counter[0] += (len(s1) + 1) * (len(s2) + 1)
+        return edit_distance_path_func(s1, s2)
+
+    path_engines[engine] = counting_edit_distance_path_func
+    try:
+        yield
+    finally:
+        path_engines[engine] = edit_distance_path_func
+
+
+def get_benchmarked_func(function_name: str, engine: str, lemmatizer, stop_words, anchored: bool):
+    """
+    Returns
+    -------
+    func: callable
+        pair -> output
+    count_cells: callable or None
+        pair -> DP cells, when the cells are not counted by `count_dp_cells`
+    """
+
+    should_run_lemmatization = lemmatizer is not None
+
+    if function_name == "edit_distance":
+        edit_distance_func = edit_distance if engine == ORIGINAL_EDIT_DISTANCE_ENGINE else EDIT_DISTANCE_ENGINES[engine]
+
+        def pair_to_tokens(pair):
+            fact_words = [word for word, _ in word_tokenize_with_spans(pair['fact'].lower())]
+            sentence_words = [word for word, _ in word_tokenize_with_spans(pair['sentence'].lower())]
+            if should_run_lemmatization:
+                return lemmatizer.lemmatize(fact_words), lemmatizer.lemmatize(sentence_words)
+            return fact_words, sentence_words
+
+        def count_cells(pair):
+            fact_tokens, sentence_tokens = pair_to_tokens(pair)
+            return (len(fact_tokens) + 1) * (len(sentence_tokens) + 1)
+
+        return lambda pair: edit_distance_func(*pair_to_tokens(pair)), count_cells
+    elif function_name == "lexical_alignment":
+        return lambda pair: lexical_alignment(pair['sentence'], pair['fact'], should_run_lemmatization=should_run_lemmatization, nlp=lemmatizer, engine=engine, anchored=anchored), None
+    elif function_name == "lexical_alignment_recursively":
+        return lambda pair: lexical_alignment_recursively(pair['sentence'], pair['fact'], should_run_lemmatization=should_run_lemmatization, nlp=lemmatizer, stop_words=stop_words, engine=engine, anchored=anchored), None
+    else:
+        raise ValueError(f"Unknown function {function_name}")
+
+
+def to_json_compatible(output):
+    return json.loads(json.dumps(output))
+
+
+def benchmark(func, count_cells, engine: str, pairs, lemmatizer):
+    """
+    Runs func on all the pairs twice, once for the wall time, and once under tracemalloc for the peak memory and the DP cells
+
+    Returns
+    -------
+    outputs: list
+    measurements: list of dict
+        Per pair
+    """
+
+    reset_caches(lemmatizer)
+    outputs = []
+    times = []
+    for pair in pairs:
+        start = perf_counter()
+        outputs.append(func(pair))
+        times.append(perf_counter() - start)
+
+    reset_caches(lemmatizer)
+    measurements = []
+    tracemalloc.start()
+    for pair, pair_time in zip(pairs, times):
+        counter = [0]
+        tracemalloc.reset_peak()
+        memory_before, _ = tracemalloc.get_traced_memory()
+        if count_cells is None:
+            with count_dp_cells(engine, counter):
+                func(pair)
+        else:
+            func(pair)
+            counter[0] = count_cells(pair)
+        _, peak = tracemalloc.get_traced_memory()
+        measurements.append({"time": pair_time, "peak_memory": peak - memory_before, "dp_cells": counter[0]})
+    tracemalloc.stop()
+
+    return outputs, measurements
+
+
+def load_reference(reference_path: str):
+    """
+    Returns
+    -------
+    reference: dict
+        (source, sentence, fact) -> outputs by function
+    stop_words: list or None
+        The stop words the reference was generated with
+    """
+
+    with open(reference_path) as f:
+        reference = json.load(f)
+
+    return {(pair['source'], pair['sentence'], pair['fact']): pair['outputs'] for pair in reference['pairs']}, reference.get('stop_words')
+
+
+def save_reference(reference_path: str, pairs, outputs_by_function: dict, stop_words):
+    reference_pairs = []
+    for pair_idx, pair in enumerate(pairs):
+        outputs = {function_name: to_json_compatible(outputs[pair_idx]) for function_name, outputs in outputs_by_function.items()}
+        reference_pairs.append({**pair, "outputs": outputs})
+
+    with open(reference_path, "w") as f:
+        json.dump({"stop_words": stop_words, "pairs": reference_pairs}, f, separators=(',', ':'))
+
+
+def main():
+    args = parse_args()
+
+    engines = args.engines.split(',')
+    function_names = args.functions.split(',')
+    lemmatizer = get_lemmatizer(backend=args.lemma_backend) if args.lemma_backend is not None else None
+    mode = args.lemma_backend if args.lemma_backend is not None else "no_lemmatization"
+    reference_path = args.reference_path if args.reference_path is not None else f"results/{args.split}/lexical_alignment_reference__{mode}.json"
+
+    pairs = load_real_pairs(args.split) + load_synthetic_pairs(args.split, [int(length) for length in args.synthetic_lengths.split(',')], args.num_synthetic_pairs)
+    print(f"{len(pairs)} pairs, mode: {mode}{', anchored' if args.anchored else ''}")
+
+    reference = None
+    reference_stop_words = None
+    if not args.save_reference:
+        if os.path.exists(reference_path):
+            reference, reference_stop_words = load_reference(reference_path)
+        else:
+            print(f"Reference {reference_path} does not exist, run with --save-reference to create it")
+
+    stop_words = None
+    if "lexical_alignment_recursively" in function_names:
+        if reference_stop_words is not None:
+            # the stop words of the reference, so the outputs are comparable
+            stop_words = reference_stop_words
+        else:
+            # same stop words as the pipeline
+            from nltk.corpus import stopwords
+            stop_words = list(stopwords.words('english')) + ["'s"]
+
+    rows = []
+    reference_outputs_by_function = {}
+    for function_name in function_names:
+        for engine in engines:
+            if engine == ORIGINAL_EDIT_DISTANCE_ENGINE and function_name != "edit_distance":
+                continue
+
+            func, count_cells = get_benchmarked_func(function_name, engine, lemmatizer, stop_words, args.anchored)
+            outputs, measurements = benchmark(func, count_cells, engine, pairs, lemmatizer)
+            if function_name not in reference_outputs_by_function:
+                reference_outputs_by_function[function_name] = outputs
+
+            for pair, output, measurement in zip(pairs, outputs, measurements):
+                matches_reference = None
+                if reference is not None:
+                    reference_outputs = reference.get((pair['source'], pair['sentence'], pair['fact']))
+                    if reference_outputs is not None and function_name in reference_outputs:
+                        matches_reference = to_json_compatible(output) == reference_outputs[function_name]
+                rows.append({"function": function_name, "engine": engine, "source": pair['source'], **measurement, "matches_reference": matches_reference})
+
+    df = pd.DataFrame(rows)
+    df['num_compared'] = df['matches_reference'].notna()
+    df['num_mismatches'] = df['matches_reference'] == False
+    summary = df.groupby(['function', 'engine', 'source'], sort=False).agg(
+        pairs=('time', 'size'),
+        total_time=('time', 'sum'),
+        ms_per_pair=('time', lambda times: 1000 * times.mean()),
+        dp_cells_per_pair=('dp_cells', 'mean'),
+        peak_kb_mean=('peak_memory', lambda peaks: peaks.mean() / 1024),
+        peak_kb_max=('peak_memory', lambda peaks: peaks.max() / 1024),
+        num_compared=('num_compared', 'sum'),
+        num_mismatches=('num_mismatches', 'sum'),
+    ).reset_index()
+
+    with pd.option_context('display.max_rows', None, 'display.width', 200, 'display.float_format', '{:.3f}'.format):
+        print(summary.to_string(index=False))
+
+    if args.output_path is not None:
+        summary.to_csv(args.output_path, index=False)
+
+    if args.save_reference:
+        save_reference(reference_path, pairs, reference_outputs_by_function, stop_words)
+        print(f"Saved the reference outputs to {reference_path}")
+    elif reference is not None:
+        num_mismatches = int(summary['num_mismatches'].sum())
+        print(f"{int(summary['num_compared'].sum())} outputs compared with the reference, {num_mismatches} mismatches")
+        if num_mismatches > 0:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
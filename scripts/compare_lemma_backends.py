@@ -0,0 +1,78 @@
+import argparse
+import glob
+from collections import Counter
+from time import time
+from src.consts import *
+from src.intermediate_io import intermediate_exists, read_intermediate
+from src.lexical_alignment.lemmatization import Lemmatizer, load_lemma_nlp
+from src.lexical_alignment.lexical_edit_distance_attribution import word_tokenize_with_spans
+
+"""
+Compares lemma backends on the words that the lexical alignment lemmatizes (sentences and facts of the saved results),
+reports the agreement with the reference backend and the speedup.
+"""
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compare lemma backends")
+
+    parser.add_argument("--split", default="test", help="Dataset split to take the facts from")
+    parser.add_argument("--reference", default=SPACY_LEMMA_BACKEND, choices=LEMMA_BACKENDS, help="The backend to compare against")
+    parser.add_argument("--candidate", default=LOOKUP_LEMMA_BACKEND, choices=LEMMA_BACKENDS, help="The backend to evaluate")
+    parser.add_argument("--num-disagreements", type=int, default=20, help="How many disagreements to print")
+
+    return parser.parse_args()
+
+
+def load_words(split: str):
+    """
+    All the words (lowercased, as in `lexical_alignment`) of the facts and their sentences
+    """
+
+    texts = []
+    paths = [f"{technique_dir}{facts_identifier}.csv" for technique_dir in glob.glob(f"results/{split}/*/*/") for facts_identifier in [FACTS_IDENTIFIER, DECONTEXTUALIZED_FACTS_IDENTIFIER]]
+    for path in [path for path in paths if intermediate_exists(path)]:
+        facts_df = read_intermediate(path)
+        texts.extend(facts_df['sentence'].tolist())
+        texts.extend(facts_df['fact'].tolist())
+
+    return [word for text in texts for word, _ in word_tokenize_with_spans(text.lower())]
+
+
+def lemmatize_with_backend(backend: str, words):
+    lemmatizer = Lemmatizer(load_lemma_nlp(backend))
+
+    start = time()
+    lemmas = lemmatizer.lemmatize(words)
+    end = time()
+
+    return lemmas, end - start
+
+
+def main():
+    args = parse_args()
+
+    words = load_words(args.split)
+    unique_words = list(dict.fromkeys(words))
+    print(f"{len(words)} words, {len(unique_words)} unique")
+
+    reference_lemmas, reference_time = lemmatize_with_backend(args.reference, unique_words)
+    candidate_lemmas, candidate_time = lemmatize_with_backend(args.candidate, unique_words)
+
+    reference_lemma_by_word = dict(zip(unique_words, reference_lemmas))
+    candidate_lemma_by_word = dict(zip(unique_words, candidate_lemmas))
+
+    unique_agreement = sum(reference_lemma_by_word[word] == candidate_lemma_by_word[word] for word in unique_words) / len(unique_words)
+    token_agreement = sum(reference_lemma_by_word[word] == candidate_lemma_by_word[word] for word in words) / len(words)
+    disagreements = Counter((word, reference_lemma_by_word[word], candidate_lemma_by_word[word]) for word in words if reference_lemma_by_word[word] != candidate_lemma_by_word[word])
+
+    print(f"Agreement ({args.candidate} vs {args.reference}): {unique_agreement:.3f} of unique words, {token_agreement:.3f} of all words")
+    print(f"Time: {args.reference} {reference_time:.3f}s, {args.candidate} {candidate_time:.3f}s (speedup x{reference_time / max(candidate_time, 1e-9):.1f})")
+
+    print("Most frequent disagreements (word, reference lemma, candidate lemma):")
+    for (word, reference_lemma, candidate_lemma), count in disagreements.most_common(args.num_disagreements):
+        print(f"{word}\t{reference_lemma}\t{candidate_lemma}\t{count}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+import argparse
+import glob
+import os
+import pandas as pd
+from src.consts import *
+from src.intermediate_io import get_intermediate_path, write_intermediate
+
+"""
+Converts the CSV intermediate results of existing runs (facts, LAQuer results and evaluation results) to Parquet, with the offsets
+as native lists of int pairs (see `src/intermediate_io.py`). The stages read the Parquet file when it exists, so a converted run
+continues from the Parquet files (run with --intermediate-format parquet to also write the next ones as Parquet).
+"""
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Convert CSV intermediate results to Parquet")
+
+    parser.add_argument("--split", default="test", help="Dataset split to convert")
+    parser.add_argument("--overwrite", action=argparse.BooleanOptionalAction, default=False, help="Whether to convert files that already have a Parquet version")
+    parser.add_argument("--remove-csv", action=argparse.BooleanOptionalAction, default=False, help="Whether to remove the CSV files once converted")
+
+    return parser.parse_args()
+
+
+def get_intermediate_csv_paths(split: str):
+    paths = glob.glob(f"results/{split}/*/*/{FACTS_IDENTIFIER}.csv") + glob.glob(f"results/{split}/*/*/{DECONTEXTUALIZED_FACTS_IDENTIFIER}.csv") + glob.glob(f"results/{split}/*/*/*_results.csv")
+    return sorted(set(paths))
+
+
+def main():
+    args = parse_args()
+
+    for csv_path in get_intermediate_csv_paths(args.split):
+        parquet_path = get_intermediate_path(csv_path, PARQUET_INTERMEDIATE_FORMAT)
+        if os.path.exists(parquet_path) and not args.overwrite:
+            print(f"{parquet_path} exists, skipping...")
+            continue
+
+        df = pd.read_csv(csv_path)
+        write_intermediate(df, csv_path, PARQUET_INTERMEDIATE_FORMAT)
+        print(f"Converted {csv_path} -> {parquet_path} ({len(df)} rows, {os.path.getsize(csv_path)} -> {os.path.getsize(parquet_path)} bytes)")
+
+        if args.remove_csv:
+            os.remove(csv_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,6 +2,7 @@ import logging
 import transformers
 import argparse
 from src.consts import *
+from src.inference.completion_cache import get_completion_cache
 from src.utils import load_results_files
 
 def parse_args():
@@ -11,6 +12,17 @@ def parse_args():
     parser.add_argument("--techniques", default="E2E,ALCE", help="Comma-separated list of techniques to process")
     parser.add_argument("--split", default="test", help="Dataset split to process")
     parser.add_argument("--entailment_model", default=TRUE_TEACHER_ENTAILMENT_MODEL_IDENTIFIER, help="Dataset split to process")
+    parser.add_argument("--max-concurrency", type=int, default=8, help="How many remote LLM calls each stage keeps in flight (1 runs them one by one), the outputs are kept in the input order")
+    parser.add_argument("--cpu-workers", type=int, default=4, help="How many processes parse and align the LLM responses (forked with the loaded models, 1 runs in the main process)")
+    parser.add_argument("--llm-cache-mode", default=LLM_CACHE_READ_WRITE_MODE, choices=LLM_CACHE_MODES, help="Whether to reuse and store the LLM completions in the on-disk cache ('read_only' never writes, 'bypass' always calls the provider)")
+    parser.add_argument("--llm-cache-path", default="results/llm_completions_cache.sqlite", help="The SQLite file of the LLM completions cache")
+    parser.add_argument("--llm-cache-max-entries", type=int, default=None, help="Evict the least recently used completions beyond this number when opening the cache")
+    parser.add_argument("--llm-cache-max-age-days", type=float, default=None, help="Evict completions older than this when opening the cache")
+    parser.add_argument("--intermediate-format", default=CSV_INTERMEDIATE_FORMAT, choices=INTERMEDIATE_FORMATS, help="The format of the intermediate results (facts, LAQuer results and evaluation results), parquet keeps the offsets as native lists of int pairs (see scripts/convert_intermediates_to_parquet.py)")
+    parser.add_argument("--alignment-engine", default=BIT_PARALLEL_ALIGNMENT_ENGINE, choices=ALIGNMENT_ENGINES, help="Edit distance implementation used for the lexical alignment of facts (all engines produce the same alignments)")
+    parser.add_argument("--lemma-backend", default=SPACY_LEMMA_BACKEND, choices=LEMMA_BACKENDS, help="How words are lemmatized for the lexical alignment, 'lookup' skips the neural pipeline (see scripts/compare_lemma_backends.py)")
+    parser.add_argument("--molecular-batch-claims", action=argparse.BooleanOptionalAction, default=False, help="Whether to decontextualize the sampled facts of each output together, with one multi-claim prompt (claims that fail to parse fall back to their own prompt)")
+    parser.add_argument("--anchored-context-alignment", action=argparse.BooleanOptionalAction, default=False, help="Whether to align decontextualized facts with the entire output only around exact-match anchors (faster on long outputs, may change alignments)")
 
     # feature flags dictating which parts of LAQuer to run
     parser.add_argument("--run-decomposition-to-facts", action=argparse.BooleanOptionalAction, default=True, help="Whether to run the decomposition to facts step")
@@ -68,6 +80,9 @@ def main():
             from src.evaluate import main as evaluate_main
             evaluate_main(task=task, split=args.split, results=results, args=args, laquer_method_name=LLM_LAQUER_METHOD)
 
+    if args.llm_cache_mode != LLM_CACHE_BYPASS_MODE:
+        logging.info(f"LLM completions cache ({args.llm_cache_mode}): {get_completion_cache(args).stats()}")
+
 
 if __name__ == '__main__':
     main()
@@ -15,4 +15,22 @@ LLM_LAQUER_METHOD = "llm"
 
 HIGHLIGHT_SEP = "<HIGHLIGHT_SEP>"
 
-TRUE_TEACHER_ENTAILMENT_MODEL_IDENTIFIER = "trueteacher"
\ No newline at end of file
+TRUE_TEACHER_ENTAILMENT_MODEL_IDENTIFIER = "trueteacher"
+
+PYTHON_ALIGNMENT_ENGINE = "python"
+NUMPY_ALIGNMENT_ENGINE = "numpy"
+BIT_PARALLEL_ALIGNMENT_ENGINE = "bit_parallel"
+ALIGNMENT_ENGINES = [PYTHON_ALIGNMENT_ENGINE, NUMPY_ALIGNMENT_ENGINE, BIT_PARALLEL_ALIGNMENT_ENGINE]
+
+SPACY_LEMMA_BACKEND = "spacy"
+LOOKUP_LEMMA_BACKEND = "lookup"
+LEMMA_BACKENDS = [SPACY_LEMMA_BACKEND, LOOKUP_LEMMA_BACKEND]
+
+LLM_CACHE_READ_WRITE_MODE = "read_write"
+LLM_CACHE_READ_ONLY_MODE = "read_only"
+LLM_CACHE_BYPASS_MODE = "bypass"
+LLM_CACHE_MODES = [LLM_CACHE_READ_WRITE_MODE, LLM_CACHE_READ_ONLY_MODE, LLM_CACHE_BYPASS_MODE]
+
+CSV_INTERMEDIATE_FORMAT = "csv"
+PARQUET_INTERMEDIATE_FORMAT = "parquet"
+INTERMEDIATE_FORMATS = [CSV_INTERMEDIATE_FORMAT, PARQUET_INTERMEDIATE_FORMAT]
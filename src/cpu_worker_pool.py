@@ -0,0 +1,67 @@
+import logging
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor, wait
+
+
+logger = logging.getLogger(__name__)
+
+# the object whose methods the workers run, inherited by the forked workers
+_worker_state = None
+
+
+def _call_worker_state(method_name: str, *args):
+    return getattr(_worker_state, method_name)(*args)
+
+
+def _noop():
+    pass
+
+
+class CPUWorkerPool:
+    """
+    Process pool for the CPU-bound post-processing of a stage (parsing the LLM responses and the lexical alignment).
+    The workers run methods of `state` (e.g., the `FactsDecomposition`), and are forked when the pool is entered, so the
+    spacy models and stop words that `state` already loaded are shared copy-on-write instead of being loaded again
+    (the lemmatization and tokenization caches are then per worker).
+    The pool should be entered before starting the LLM threads, so the workers are not forked while a thread holds a lock.
+
+    With num_workers <= 1, or where fork is not available, the methods run in the calling process.
+    """
+
+    def __init__(self, state, num_workers: int):
+        self.state = state
+        self.num_workers = num_workers if 'fork' in multiprocessing.get_all_start_methods() else 1
+        self.executor = None
+
+    def __enter__(self):
+        global _worker_state
+
+        if self.num_workers > 1:
+            _worker_state = self.state
+            self.executor = ProcessPoolExecutor(max_workers=self.num_workers, mp_context=multiprocessing.get_context('fork'))
+            wait([self.executor.submit(_noop) for _ in range(self.num_workers)])  # fork all the workers now
+            logger.info(f"Started {self.num_workers} CPU workers")
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        global _worker_state
+
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=exc_type is not None)
+            self.executor = None
+            _worker_state = None
+
+    def submit(self, method_name: str, *args) -> Future:
+        """
+        Run state.method_name(*args) in a worker (the arguments and the result are pickled)
+        """
+
+        if self.executor is not None:
+            return self.executor.submit(_call_worker_state, method_name, *args)
+
+        future = Future()
+        try:
+            future.set_result(getattr(self.state, method_name)(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
@@ -1,19 +1,28 @@
-import json
 import logging
-import os
+from collections import defaultdict
+from contextlib import ExitStack
+from typing import Callable, List, Optional
+import numpy as np
 import pandas as pd
 import spacy
-from tqdm import tqdm
-import transformers
 
 from src.consts import FACTS_IDENTIFIER
-from src.lexical_alignment.lexical_edit_distance_attribution import lexical_alignment_recursively
-from src.utils import dedup_and_sort_spans
+from src.cpu_worker_pool import CPUWorkerPool
+from src.inference.utils import run_concurrently
+from src.intermediate_io import intermediate_exists, write_intermediate
+from src.journal import Journal
+from src.lexical_alignment.lemmatization import get_lemmatizer
+from src.lexical_alignment.lexical_edit_distance_attribution import lexical_alignment_batch
+from src.lexical_alignment.tokenization import get_span_tokenizer
+from src.response_log import ResponseLog
+from src.utils import OffsetMapper, dedup_and_sort_spans
 from src.third_party.factscore import FActScoreDecomposition
 
 
 logger = logging.getLogger(__name__)
 
+SENT_SEGMENTATION_BATCH_SIZE = 32
+
 
 
 
@@ -25,43 +34,29 @@ def fix_local_offset_to_doc_offset(offset, doc_span_offsets):
     ('test36_0.txt_[[191, 271]]', (63,66)) -> ('test36_0.txt_[[191, 271]]', (191+63, 191+66))
     ('test36_0.txt_[[100, 200], [300, 400]]', (120,140)) -> ('test36_0.txt_[[100, 200], [300, 400]]', (300+120-100-1, 300+140-100-1))
     ('test36_0.txt_[[100, 200], [300, 400]]', (80,200)) -> ('test36_0.txt_[[100, 200], [300, 400]]', [(100+80, 200-1), (300, 300+60-1)])
+    
+    To map many offsets of the same source, build its `OffsetMapper` once.
     """
 
-    new_offsets = []
-
-    diff = 0
-    for doc_span_offset in doc_span_offsets:
-        doc_span_char_idx = doc_span_offset[0]
-        if offset[0] + doc_span_char_idx - diff < doc_span_offset[1]:
-            
-            new_offset = (doc_span_offset[0] - diff + offset[0], doc_span_offset[0] - diff + offset[1])
-            is_overflowing = new_offset[1] > doc_span_offset[1]
-            if not is_overflowing:
-                new_offsets.append(new_offset)
-                return new_offsets
-            else:
-                new_offset = (new_offset[0], doc_span_offset[1])
-                new_offsets.append(new_offset)
-                
-                distance_completed = new_offset[1] - new_offset[0]
-                offset = (offset[0] + distance_completed, offset[1])
-                
-        diff += doc_span_offset[1] - doc_span_offset[0] + 1  # + 1 for space between spans
-    raise ValueError(f"offset {offset} not found in {doc_span_offsets}")
+    return OffsetMapper(doc_span_offsets).map(offset)
 
 
 class FactsDecomposition:
     def __init__(self, args):
         self.nlp = spacy.load("en_core_web_sm")
-        self.nlp_lemma_only = spacy.load("en_core_web_sm", enable=['tok2vec', 'tagger', 'attribute_ruler', 'lemmatizer'])
+        self.lemmatizer = get_lemmatizer(backend=args.lemma_backend)
         from nltk.corpus import stopwords
         self.stop_words = list(stopwords.words('english')) + ["'s"]
         
+        self.alignment_engine = args.alignment_engine
+        self.max_concurrency = args.max_concurrency
+        self.cpu_workers = args.cpu_workers
+        
         self.factscore_decomposition = FActScoreDecomposition(args)
 
     def extract_decomposition(self, datapoint):
         response = self.factscore_decomposition.decompose(datapoint)
-        results = self.parse_response(datapoint, response)
+        results = self.place_facts(self.parse_response(datapoint, response), datapoint)
         
         return {
                 "results": results,
@@ -69,9 +64,68 @@ class FactsDecomposition:
                 **datapoint
             }
 
+    def extract_decompositions(self, datapoints, journal: Journal = None, log_response: Optional[Callable[[int, dict], None]] = None) -> List[pd.DataFrame]:
+        """
+        Same as `extract_decomposition` for all the datapoints. The LLM calls run concurrently, and each response is parsed and aligned
+        on the CPU workers as soon as it arrives.
+        Identical sentences (e.g., the same generated sentence in several instances or techniques) are decomposed and aligned once,
+        and the facts fan back out to every occurrence with its own scuSentCharIdx and unique_id.
+        The LLM responses are appended to the journal as they arrive, and journaled sentences are not sent again.
+        As each response arrives, it is passed to `log_response` as (datapoint_idx, {**response, **datapoint}) for every occurrence of its
+        sentence, and is not kept afterwards.
+        
+        Returns
+        -------
+        results: List[pd.DataFrame]
+            The facts of each datapoint
+        """
+        
+        datapoint_idxs_by_sentence = defaultdict(list)
+        for datapoint_idx, datapoint in enumerate(datapoints):
+            datapoint_idxs_by_sentence[datapoint['sentence']].append(datapoint_idx)
+        sentences = list(datapoint_idxs_by_sentence)
+        logger.info(f"Decomposing {len(sentences)} unique sentences out of {len(datapoints)} ({len(datapoints) - len(sentences)} LLM calls saved)")
+        unique_datapoints = [{"sentence": sentence} for sentence in sentences]
+        
+        with CPUWorkerPool(self, self.cpu_workers) as cpu_worker_pool:
+            facts_futures = [None] * len(unique_datapoints)
+            
+            def parse_when_ready(unique_datapoint_idx, response):
+                facts_futures[unique_datapoint_idx] = cpu_worker_pool.submit('parse_response', unique_datapoints[unique_datapoint_idx], response)
+                if log_response is not None:
+                    for datapoint_idx in datapoint_idxs_by_sentence[sentences[unique_datapoint_idx]]:
+                        log_response(datapoint_idx, {**response, **datapoints[datapoint_idx]})
+            
+            run_concurrently(self.factscore_decomposition.decompose, unique_datapoints, max_concurrency=self.max_concurrency, desc="Decomposing sentences", journal=journal, callback=parse_when_ready, keep_results=False)
+            
+            sentence_to_facts = {sentence: facts_future.result() for sentence, facts_future in zip(sentences, facts_futures)}
+        
+        return [self.place_facts(sentence_to_facts[datapoint['sentence']], datapoint) for datapoint in datapoints]
+
+    def place_facts(self, facts: pd.DataFrame, datapoint) -> pd.DataFrame:
+        """
+        Places the facts of a sentence (see `parse_response`) in the output, the local offsets (in the sentence) are fixed to offsets in
+        the output using the datapoint's scuSentCharIdx.
+        """
+        
+        if facts.empty:
+            return facts
+        
+        facts = facts.copy()
+        facts['scuSentCharIdx'] = datapoint['scuSentCharIdx']
+        facts['unique_id'] = datapoint['unique_id']
+        
+        sent_char_idx = int(datapoint['scuSentCharIdx'])
+        output_offset = [(sent_char_idx, sent_char_idx + len(datapoint['sentence']))]
+        output_offset_mapper = OffsetMapper(output_offset)
+        facts['factOffsets'] = [output_offset_mapper.map_all(local_fact_offsets) for local_fact_offsets in facts['local_factOffsets']]
+        
+        return facts
 
     def parse_response(self, datapoint, response):
         """
+        The facts of the sentence, aligned with it (the offsets are local to the sentence, see `place_facts`).
+        
         Example response:
         - One is spewing ash onto an island.
         - One is spewing rock onto an island.
@@ -86,10 +140,11 @@ class FactsDecomposition:
             if line.strip() == '':
                 return None
             
+            return line
+        
+        def build_fact_row(line, alignments, tokenized_text_to_align):
             sentence = datapoint['sentence']
-            fact_text = line
             
-            alignments, tokenized_text_to_align = lexical_alignment_recursively(sentence=sentence, fact_text=fact_text, should_run_lemmatization=True, nlp=self.nlp_lemma_only, stop_words=self.stop_words)
             alignments_flattened = [word_alignment[1] for word_alignment in alignments.values() if word_alignment is not None]
             alignments_flattened = dedup_and_sort_spans(alignments_flattened)
             missing = [tokenized_text_to_align[word_idx] for word_idx, word_alignments in alignments.items() if word_alignments == []]
@@ -106,53 +161,110 @@ class FactsDecomposition:
                 "sentence": sentence,
                 "fact": line,
                 "fact_offsets_concatenated": fact_offsets_concatenated,
-                "local_factOffsets": fact_offsets,
-                "scuSentCharIdx": datapoint['scuSentCharIdx'],
-                "unique_id": datapoint['unique_id']
+                "local_factOffsets": fact_offsets
             }
-
-            def fix_facts_offsets_to_output_offset(row):
-                output_offset = [(row['scuSentCharIdx'], row['scuSentCharIdx'] + len(row['sentence']))]
-                
-                new_offsets = []
-                for offset in row['local_factOffsets']:
-                    new_offset = fix_local_offset_to_doc_offset(offset, output_offset)
-                    new_offsets.extend(new_offset)
-
-                return new_offsets
-            
-            fact_offsets = fix_facts_offsets_to_output_offset(fact_row)
-            
-            fact_row['factOffsets'] = fact_offsets
             
             return fact_row
             
 
         parsed_lines = [parse_line(line) for line in response['text'].split('\n')]
-        return pd.DataFrame([line for line in parsed_lines if line is not None])
+        parsed_lines = [line for line in parsed_lines if line is not None]
+        
+        # all the facts are aligned with the same sentence
+        facts_alignments = lexical_alignment_batch(sentence=datapoint['sentence'], fact_texts=parsed_lines, should_run_lemmatization=True, nlp=self.lemmatizer, stop_words=self.stop_words, engine=self.alignment_engine)
+        
+        return pd.DataFrame([build_fact_row(line, alignments, tokenized_text_to_align) for line, (alignments, tokenized_text_to_align) in zip(parsed_lines, facts_alignments)])
                 
     
     def get_instance_sents(self, instance):
-        highlights_df = pd.DataFrame(instance['set_of_highlights_in_context'])
-        does_have_decomposed_sents = not highlights_df.empty
-        # If the output has a decomopsed version of the response into sents, use that to avoid creating mismatches later
-        if does_have_decomposed_sents:
-            def extract_sent_obj(rows):
-                any_row = rows.iloc[0]
-                return {
+        return self.get_instances_sents([instance])
+
+    def get_instances_sents(self, instances):
+        """
+        The sentences of all the instances, in order.
+        The instances are iterated once (e.g., streamed from a `ResultsFile`), only the responses that need segmentation are kept.
+        Outputs without decomposed sentences are segmented together with `nlp.pipe`, only the parser is needed for the sentence boundaries
+        (the tagger is kept as well, the parser's boundaries don't depend on the other components).
+        """
+        
+        instances_sents_objs = []
+        instances_to_segment = []
+        for instance_idx, instance in enumerate(instances):
+            highlights_df = pd.DataFrame(instance['set_of_highlights_in_context'])
+            does_have_decomposed_sents = not highlights_df.empty
+            # If the output has a decomopsed version of the response into sents, use that to avoid creating mismatches later
+            if does_have_decomposed_sents:
+                # one row per sentence (the first one, ordered by scuSentCharIdx, same as grouping by it)
+                sents_rows = highlights_df.dropna(subset=['scuSentCharIdx']).drop_duplicates('scuSentCharIdx').sort_values('scuSentCharIdx', kind='stable')
+                instances_sents_objs.append([{
                     "unique_id": instance['unique_id'],
-                    "scuSentCharIdx": any_row['scuSentCharIdx'],
-                    "sentence": any_row['scuSentence']
-                }
-            return highlights_df.groupby('scuSentCharIdx').apply(extract_sent_obj).tolist()
-        else:
-            doc = self.nlp(instance['response'])
-            return [{
-                "unique_id": instance['unique_id'],
-                "scuSentCharIdx": sent.start_char,
-                "sentence": sent.text
-            } for sent in doc.sents]
+                    "scuSentCharIdx": sents_rows.iloc[row_idx]['scuSentCharIdx'],
+                    "sentence": sents_rows.iloc[row_idx]['scuSentence']
+                } for row_idx in range(len(sents_rows))])
+            else:
+                instances_sents_objs.append(None)
+                instances_to_segment.append((instance_idx, instance['unique_id'], instance['response']))
+        
+        if len(instances_to_segment) > 0:
+            disabled_pipes = [pipe_name for pipe_name in ['ner', 'attribute_ruler', 'lemmatizer'] if pipe_name in self.nlp.pipe_names]
+            with self.nlp.select_pipes(disable=disabled_pipes):
+                responses = [response for _, _, response in instances_to_segment]
+                docs = self.nlp.pipe(responses, batch_size=SENT_SEGMENTATION_BATCH_SIZE, n_process=min(self.cpu_workers, len(responses)))
+                for (instance_idx, unique_id, _), doc in zip(instances_to_segment, docs):
+                    instances_sents_objs[instance_idx] = [{
+                        "unique_id": unique_id,
+                        "scuSentCharIdx": sent.start_char,
+                        "sentence": sent.text
+                    } for sent in doc.sents]
+        
+        return [sent_obj for instance_sents_objs in instances_sents_objs for sent_obj in instance_sents_objs]
             
+
+def number_and_sample_facts(results: pd.DataFrame, seed: int = 42, num_to_sample: int = 10) -> pd.DataFrame:
+    """
+    Number the facts of each instance (fact_idx), sample `num_to_sample` facts per instance (is_sampled), and one fact per summary sentence
+    (is_sampled__summary_sent, when evaluating with humans, they will see the same sentence attribution if we show them different facts from same sentence).
+    
+    Reproduces the per-instance `transformers.set_seed(seed)` + `DataFrame.sample` of the original implementation: sampling k rows out of n
+    takes the first k positions of `RandomState(seed).permutation(n)`, and the per-sentence samples continue the same random state,
+    sentence by sentence in the order of scuSentCharIdx. The permutations depend only on the sizes, so they are computed once per size.
+    The rows are ordered by unique_id (stable), as grouping by it.
+    """
+    
+    results = results.sort_values('unique_id', kind='stable').reset_index(drop=True)
+    
+    results['fact_idx'] = results.groupby('unique_id').cumcount()
+    
+    num_facts = results.groupby('unique_id')['unique_id'].transform('size').to_numpy()
+    fact_idxs = results['fact_idx'].to_numpy()
+    is_sampled = num_facts < num_to_sample
+    for size in np.unique(num_facts[num_facts >= num_to_sample]):
+        size_rows = num_facts == size
+        sampled_idxs = np.random.RandomState(seed).permutation(size)[:num_to_sample]
+        is_sampled[size_rows] = np.isin(fact_idxs[size_rows], sampled_idxs)
+    results['is_sampled'] = is_sampled
+    
+    # the position of each fact among the facts of its sentence, and the sentences of each instance by their order
+    summary_sent_groups = results.groupby(['unique_id', 'scuSentCharIdx'], sort=True)
+    fact_idxs_in_summary_sent = summary_sent_groups.cumcount().to_numpy()
+    summary_sent_ids = summary_sent_groups.ngroup().to_numpy()
+    summary_sents = summary_sent_groups.size().reset_index(name='num_facts')
+    
+    sampled_idx_by_summary_sent = np.empty(len(summary_sents), dtype=np.int64)
+    sampled_idxs_by_sizes = {}
+    summary_sent_id = 0
+    for summary_sents_sizes in summary_sents.groupby('unique_id', sort=True)['num_facts']:
+        summary_sents_sizes = tuple(summary_sents_sizes[1].tolist())
+        if summary_sents_sizes not in sampled_idxs_by_sizes:
+            random_state = np.random.RandomState(seed)
+            sampled_idxs_by_sizes[summary_sents_sizes] = [random_state.permutation(size)[0] for size in summary_sents_sizes]
+        sampled_idx_by_summary_sent[summary_sent_id:summary_sent_id + len(summary_sents_sizes)] = sampled_idxs_by_sizes[summary_sents_sizes]
+        summary_sent_id += len(summary_sents_sizes)
+    results['is_sampled__summary_sent'] = fact_idxs_in_summary_sent == sampled_idx_by_summary_sent[summary_sent_ids]
+    
+    return results
+
+
 def get_facts_path(split, task, technique):
     return f'results/{split}/{task}/{technique}/{FACTS_IDENTIFIER}.csv'
      
@@ -166,76 +278,51 @@ def main(task: str, split: str, results: dict, args):
     
     facts_decomposition = FactsDecomposition(args)
     
+    techniques_sents_objs = {}
     for technique, technique_obj in results.items():
         logger.info(f"Technique: {technique}")
         
         results_path = get_facts_path(split, task, technique)
-        responses_path = f'results/{split}/{task}/{technique}/{FACTS_IDENTIFIER}_responses.csv'
         
-        if os.path.exists(results_path):
+        if intermediate_exists(results_path):
             logger.info(f"Fact decomposition results path {results_path} exists, skipping...")
             continue
                         
-        all_sents_objs = []
-        for instance in technique_obj['results']:
-            sents_objs = facts_decomposition.get_instance_sents(instance)
-            all_sents_objs.extend(sents_objs)
-                        
-        results_and_responses = [facts_decomposition.extract_decomposition(sent_obj) for sent_obj in tqdm(all_sents_objs)]
-        results = pd.concat([result_and_response['results'] for result_and_response in results_and_responses])
-        responses = pd.DataFrame([{k: json.dumps(v) if isinstance(v, dict) else v for k, v in result_and_response.items() if k != 'results'} for result_and_response in results_and_responses])
-
-        # filter out examples that the algo failed to align
-        results = results[results['factscore_num_content_missing'] <= 1]
-
-        def number_facts(rows):
-            rows['fact_idx'] = range(len(rows))
-            return rows
-        
-        def sample_results(rows):
-            num_to_sample = 10
-            rows = rows.reset_index(drop=True)
-            rows['is_sampled'] = False
-            transformers.set_seed(42)
-            # sample 10 rows and update the column
-            if rows.shape[0] < num_to_sample:
-                rows['is_sampled'] = True
-            else:
-                sampled_rows = rows.sample(num_to_sample)
-                rows.loc[sampled_rows.index, 'is_sampled'] = True
-            
-            return rows
-
-        def sample_per_summary_sent(rows):
-            """
-            When evaluating with humans, they will see the same sentence attribution if we show them different facts from same sentence, so we want to sample one fact per summary sentence
-            """
-
-            rows = rows.reset_index(drop=True)
-            rows['is_sampled__summary_sent'] = False
-            transformers.set_seed(42)
-            
-            def _sample_per_summary_sent(summary_sent_rows):
-                sampled_rows = summary_sent_rows.sample(1)
-                rows.loc[sampled_rows.index, 'is_sampled__summary_sent'] = True
+        techniques_sents_objs[technique] = facts_decomposition.get_instances_sents(technique_obj['results'].iter_instances(fields=['unique_id', 'response', 'set_of_highlights_in_context']))
+    
+    if len(techniques_sents_objs) > 0:
+        # the sentences of all the techniques are decomposed together, so sentences that they share are decomposed once
+        all_sents_objs = [sent_obj for sents_objs in techniques_sents_objs.values() for sent_obj in sents_objs]
+        # the technique of each sentence and its index in the technique's sentences
+        sents_positions = [(technique, sent_idx) for technique, sents_objs in techniques_sents_objs.items() for sent_idx in range(len(sents_objs))]
+        journal = Journal(f'results/{split}/{task}/{FACTS_IDENTIFIER}.journal')
+        with ExitStack() as exit_stack:
+            response_logs = {technique: exit_stack.enter_context(ResponseLog(f'results/{split}/{task}/{technique}/{FACTS_IDENTIFIER}_responses.jsonl')) for technique in techniques_sents_objs}
             
-            rows.groupby('scuSentCharIdx').apply(_sample_per_summary_sent)
+            def log_response(datapoint_idx, record):
+                technique, sent_idx = sents_positions[datapoint_idx]
+                response_logs[technique].write(sent_idx, record)
             
-            return rows
-        
+            all_results = facts_decomposition.extract_decompositions(all_sents_objs, journal=journal, log_response=log_response)
         
-        def sample_and_number(rows):
-            rows = number_facts(rows)
-            rows = sample_results(rows)
-            rows = sample_per_summary_sent(rows)
-            return rows
+        technique_start_idx = 0
+        for technique, sents_objs in techniques_sents_objs.items():
+            results_path = get_facts_path(split, task, technique)
+            
+            results = pd.concat(all_results[technique_start_idx:technique_start_idx + len(sents_objs)])
+            technique_start_idx += len(sents_objs)
 
-        results = results.groupby('unique_id').apply(sample_and_number)
+            # filter out examples that the algo failed to align
+            results = results[results['factscore_num_content_missing'] <= 1]
 
-        def save_func(results, responses):
-            logging.info(f"Saving factscore results to {results_path}")
-            results.to_csv(results_path, index=False)
-            
-            responses.to_csv(responses_path, index=False)
-            
-        save_func(results, responses)
+            results = number_and_sample_facts(results)
+
+            def save_func(results):
+                saved_path = write_intermediate(results, results_path, args.intermediate_format)
+                logging.info(f"Saved factscore results to {saved_path}")
+                
+            save_func(results)
+        journal.remove()
+
+    logger.info(f"Tokenization cache: {get_span_tokenizer().stats()}")
+    logger.info(f"Lemmatization cache: {facts_decomposition.lemmatizer.stats()}")
@@ -1,19 +1,28 @@
-import json
 import logging
-import os
+from collections import OrderedDict, defaultdict
+from typing import List
 import pandas as pd
 import spacy
-from tqdm import tqdm
 
-from src.consts import DECONTEXTUALIZED_FACTS_IDENTIFIER
-from src.decompose_to_facts import fix_local_offset_to_doc_offset, get_facts_path
-from src.lexical_alignment.lexical_edit_distance_attribution import lexical_alignment_recursively
-from src.third_party.molecular_facts import MolecularFactsDecontextualization
-from src.utils import dedup_and_sort_spans
+from src.consts import DECONTEXTUALIZED_FACTS_IDENTIFIER, PYTHON_ALIGNMENT_ENGINE, SPACY_LEMMA_BACKEND
+from src.cpu_worker_pool import CPUWorkerPool
+from src.decompose_to_facts import get_facts_path
+from src.inference.utils import run_concurrently
+from src.intermediate_io import intermediate_exists, parse_offsets, read_intermediate, write_intermediate
+from src.journal import Journal, get_journal_path
+from src.lexical_alignment.lemmatization import get_lemmatizer
+from src.lexical_alignment.lexical_edit_distance_attribution import TokenizedText, lexical_alignment_batch
+from src.lexical_alignment.tokenization import get_span_tokenizer
+from src.response_log import ResponseLog
+from src.third_party.molecular_facts import MOLECULAR_MAX_CLAIMS_PER_PROMPT, MolecularFactsDecontextualization
+from src.span_set import SpanSet
+from src.utils import OffsetMapper, dedup_and_sort_spans
 
 
 logger = logging.getLogger(__name__)
 
+RESPONSE_CONTEXTS_CACHE_SIZE = 64
+
 
 
 
@@ -22,7 +31,10 @@ class DecontextualizeFacts:
         self.molecular_facts_decontextualization = MolecularFactsDecontextualization(args)
 
         self.nlp = spacy.load("en_core_web_sm")
-        self.fact_to_output_attribution = FactToOutputAttribution()
+        self.fact_to_output_attribution = FactToOutputAttribution(alignment_engine=args.alignment_engine, anchored_context_alignment=args.anchored_context_alignment, lemma_backend=args.lemma_backend)
+        self.max_concurrency = args.max_concurrency
+        self.cpu_workers = args.cpu_workers
+        self.molecular_batch_claims = args.molecular_batch_claims
 
     def decontextualize(self, datapoint):
         explanation, disambig_decontext, response = self.molecular_facts_decontextualization.decontextualize(datapoint)
@@ -33,21 +45,76 @@ class DecontextualizeFacts:
                 **response,
                 **datapoint
             }
+    
+    def decontextualize_all(self, datapoints, journal: Journal = None, response_log: ResponseLog = None) -> List[pd.DataFrame]:
+        """
+        Decontextualize all the facts with the LLM (the calls run concurrently), and align them with the outputs on the CPU workers.
+        With `molecular_batch_claims`, the facts of the same output are decontextualized together, up to MOLECULAR_MAX_CLAIMS_PER_PROMPT per prompt
+        (see `MolecularFactsDecontextualization.decontextualize_claims`), otherwise each fact has its own prompt.
+        The facts of the same output are aligned together (they share the sentences and the context), as soon as all of them are decontextualized.
+        The LLM outputs are appended to the journal as they arrive, and journaled facts are not sent again.
+        Each response (with its datapoint) is written to `response_log` as it arrives, and is not kept afterwards.
+
+        Returns
+        -------
+        results: List[pd.DataFrame]
+            The aligned facts of each datapoint
+        """
+        
+        datapoint_idxs_by_context = defaultdict(list)
+        for datapoint_idx, datapoint in enumerate(datapoints):
+            datapoint_idxs_by_context[datapoint['context']].append(datapoint_idx)
+        
+        if self.molecular_batch_claims:
+            datapoint_idxs_batches = [datapoint_idxs[batch_start:batch_start + MOLECULAR_MAX_CLAIMS_PER_PROMPT] for datapoint_idxs in datapoint_idxs_by_context.values() for batch_start in range(0, len(datapoint_idxs), MOLECULAR_MAX_CLAIMS_PER_PROMPT)]
+            logger.info(f"Decontextualizing {len(datapoints)} facts with {len(datapoint_idxs_batches)} multi-claim prompts")
+        else:
+            datapoint_idxs_batches = [[datapoint_idx] for datapoint_idx in range(len(datapoints))]
+        
+        with CPUWorkerPool(self, self.cpu_workers) as cpu_worker_pool:
+            outputs = [None] * len(datapoints)
+            num_missing_by_context = {context: len(datapoint_idxs) for context, datapoint_idxs in datapoint_idxs_by_context.items()}
+            results_futures = {}
+            
+            def parse_when_ready(batch_idx, batch_outputs):
+                for datapoint_idx, (explanation, disambig_decontext, response) in zip(datapoint_idxs_batches[batch_idx], batch_outputs):
+                    outputs[datapoint_idx] = (explanation, disambig_decontext)
+                    if response_log is not None:
+                        response_log.write(datapoint_idx, {**response, **datapoints[datapoint_idx]})
+                    context = datapoints[datapoint_idx]['context']
+                    num_missing_by_context[context] -= 1
+                    if num_missing_by_context[context] == 0:
+                        datapoint_idxs = datapoint_idxs_by_context[context]
+                        results_futures[context] = cpu_worker_pool.submit('parse_responses', [datapoints[idx] for idx in datapoint_idxs], [outputs[idx] for idx in datapoint_idxs])
+            
+            datapoints_batches = [[datapoints[datapoint_idx] for datapoint_idx in datapoint_idxs] for datapoint_idxs in datapoint_idxs_batches]
+            run_concurrently(self.molecular_facts_decontextualization.decontextualize_claims, datapoints_batches, max_concurrency=self.max_concurrency, desc="Decontextualizing facts", journal=journal, callback=parse_when_ready)
+            
+            results = [None] * len(datapoints)
+            for context, datapoint_idxs in datapoint_idxs_by_context.items():
+                for datapoint_idx, datapoint_results in zip(datapoint_idxs, results_futures[context].result()):
+                    results[datapoint_idx] = datapoint_results
+        
+        return results
         
 
     def parse_response(self, datapoint, explanation: str, disambig_decontext: str) -> pd.DataFrame:
+        return self.parse_responses([datapoint], [(explanation, disambig_decontext)])[0]
+
+    def parse_responses(self, datapoints, decontextualizations) -> List[pd.DataFrame]:
 
-        fact_row = {
+        fact_rows = [{
             "explanation": explanation,
             **datapoint,
             "factscore_fact": datapoint['fact'],
             "fact": disambig_decontext
-        }
+        } for datapoint, (explanation, disambig_decontext) in zip(datapoints, decontextualizations)]
 
-        alignments_flattened, _ = self.fact_to_output_attribution.attribute_fact_with_entire_output(fact_row)
-        fact_row['factOffsets'] = alignments_flattened
+        facts_alignments = self.fact_to_output_attribution.attribute_facts_with_entire_output(fact_rows)
+        for fact_row, (alignments_flattened, _) in zip(fact_rows, facts_alignments):
+            fact_row['factOffsets'] = alignments_flattened
 
-        return pd.DataFrame([fact_row])
+        return [pd.DataFrame([fact_row]) for fact_row in fact_rows]
 
     def get_datapoint(self, fact_row, context: str):
         return {
@@ -58,26 +125,106 @@ class DecontextualizeFacts:
         
                         
     
+class ResponseContext:
+    """
+    The entire output (the response) that the facts of an instance are aligned with, prepared once per response and reused by all its facts:
+    the tokenized and lemmatized context, its sentences (interned with the same vocabulary), and the offsets of the sentences in the context.
+    """
+
+    def __init__(self, context: str, lemmatizer):
+        self.context = context
+        self.lemmatizer = lemmatizer
+        self.tokenized_context = TokenizedText(context, lemmatizer=lemmatizer)
+        self.vocabulary = self.tokenized_context.vocabulary
+        self.tokenized_sentences = {}
+        self.sentence_offset_mappers = {}
+
+    def tokenized_sentence(self, sentence: str) -> TokenizedText:
+        if sentence not in self.tokenized_sentences:
+            self.tokenized_sentences[sentence] = TokenizedText(sentence, lemmatizer=self.lemmatizer, vocabulary=self.vocabulary)
+        return self.tokenized_sentences[sentence]
+
+    def sentence_offset_mapper(self, sentence: str) -> OffsetMapper:
+        """
+        Maps offsets in the sentence to offsets in the context
+        """
+
+        if sentence not in self.sentence_offset_mappers:
+            # the offsets of the sentence within the context
+            doc_sent_char_idx = self.context.index(sentence)
+            self.sentence_offset_mappers[sentence] = OffsetMapper([(doc_sent_char_idx, doc_sent_char_idx + len(sentence))])
+        return self.sentence_offset_mappers[sentence]
+
+
 class FactToOutputAttribution:
-    def __init__(self):
-        self.nlp_lemma_only = spacy.load("en_core_web_sm", enable=['tok2vec', 'tagger', 'attribute_ruler', 'lemmatizer'])
+    def __init__(self, alignment_engine: str = PYTHON_ALIGNMENT_ENGINE, anchored_context_alignment: bool = False, lemma_backend: str = SPACY_LEMMA_BACKEND):
+        self.alignment_engine = alignment_engine
+        # the context is the entire output, anchoring makes the alignment cost scale with the fact rather than the output
+        self.anchored_context_alignment = anchored_context_alignment
+        self.lemmatizer = get_lemmatizer(backend=lemma_backend)
         from nltk.corpus import stopwords
         self.stop_words = list(stopwords.words('english')) + ["'s"]
+        
+        # unique_id -> ResponseContext, of the recently aligned responses
+        self.response_contexts = OrderedDict()
+
+    def get_response_context(self, datapoint) -> ResponseContext:
+        unique_id = datapoint['unique_id']
+        response_context = self.response_contexts.get(unique_id)
+        if response_context is None or response_context.context != datapoint['context']:
+            response_context = ResponseContext(datapoint['context'], self.lemmatizer)
+            self.response_contexts[unique_id] = response_context
+            if len(self.response_contexts) > RESPONSE_CONTEXTS_CACHE_SIZE:
+                self.response_contexts.popitem(last=False)
+        self.response_contexts.move_to_end(unique_id)
+        return response_context
 
     def attribute_fact_with_entire_output(self, datapoint):
+        return self.attribute_facts_with_entire_output([datapoint])[0]
+
+    def attribute_facts_with_entire_output(self, datapoints):
         """
         Start by attributing based on the sentence, then whatever is left attribute based on the entire context.
         This is necessary because molecular can fetch context from outside the highlight
+        
+        Facts that share the same sentence (or context) are aligned with it in a single batch, and the context of each response
+        is prepared once (see `ResponseContext`).
         """
 
         # remove the dot at the end of the fact, because it is an artifact of the generation of facts and will be aligned with the dot of the original sentence which is usually incorrect (except possibly for the last fact)
-        fact_text = datapoint['fact'] if datapoint['fact'][-1] != '.' else datapoint['fact'][:-1]
+        fact_texts = [datapoint['fact'] if datapoint['fact'][-1] != '.' else datapoint['fact'][:-1] for datapoint in datapoints]
+        response_contexts = [self.get_response_context(datapoint) for datapoint in datapoints]
 
         # Align sentence
-        sentence_alignments, tokenized_text_to_align = lexical_alignment_recursively(sentence=datapoint['sentence'], fact_text=fact_text, should_run_lemmatization=True, nlp=self.nlp_lemma_only, stop_words=self.stop_words)
+        sentence_alignments = self._align_batches(datapoints, response_contexts, fact_texts, parent_key='sentence', anchored=False)
         
         # Align context (separately because doing them together can potentially mess the recursive algorithm)
-        context_alignments, tokenized_text_to_align = lexical_alignment_recursively(sentence=datapoint['context'], fact_text=fact_text, should_run_lemmatization=True, nlp=self.nlp_lemma_only, stop_words=self.stop_words)
+        context_alignments = self._align_batches(datapoints, response_contexts, fact_texts, parent_key='context', anchored=self.anchored_context_alignment)
+
+        return [self._merge_alignments(datapoint, response_context, datapoint_sentence_alignments, datapoint_context_alignments) for datapoint, response_context, datapoint_sentence_alignments, datapoint_context_alignments in zip(datapoints, response_contexts, sentence_alignments, context_alignments)]
+    
+    def _align_batches(self, datapoints, response_contexts, fact_texts, parent_key: str, anchored: bool):
+        """
+        Align each fact text with datapoint[parent_key], batched by the response and the parent text
+        """
+        
+        datapoint_idxs_by_parent = defaultdict(list)
+        for datapoint_idx, datapoint in enumerate(datapoints):
+            datapoint_idxs_by_parent[(datapoint['unique_id'], datapoint[parent_key])].append(datapoint_idx)
+        
+        alignments = [None] * len(datapoints)
+        for (_, parent_text), datapoint_idxs in datapoint_idxs_by_parent.items():
+            response_context = response_contexts[datapoint_idxs[0]]
+            parent = response_context.tokenized_context if parent_key == 'context' else response_context.tokenized_sentence(parent_text)
+            batch_alignments = lexical_alignment_batch(sentence=parent, fact_texts=[fact_texts[datapoint_idx] for datapoint_idx in datapoint_idxs], should_run_lemmatization=True, nlp=self.lemmatizer, stop_words=self.stop_words, engine=self.alignment_engine, anchored=anchored)
+            for datapoint_idx, datapoint_alignments in zip(datapoint_idxs, batch_alignments):
+                alignments[datapoint_idx] = datapoint_alignments
+        
+        return alignments
+
+    def _merge_alignments(self, datapoint, response_context: ResponseContext, sentence_alignments, context_alignments):
+        sentence_alignments, tokenized_text_to_align = sentence_alignments
+        context_alignments, tokenized_text_to_align = context_alignments
 
         # add newly found alignments
         sentence_alignments_flattened = []
@@ -95,20 +242,14 @@ class FactToOutputAttribution:
                 if is_content_word:
                     context_alignments_flattened.append(word_context_alignments[1])
         
-        # the offsets of the sentence within the context. doesn't need to be re-calculated, should be saved earlier.
-        doc_sent_char_idx = datapoint['context'].index(datapoint['sentence'])
-        doc_span_offsets = (doc_sent_char_idx, doc_sent_char_idx + len(datapoint['sentence']))
-        
         sentence_alignments_flattened = dedup_and_sort_spans(sentence_alignments_flattened)
-        sentence_alignments_flattened = [offset_parsed for x in sentence_alignments_flattened for offset_parsed in fix_local_offset_to_doc_offset(x, [doc_span_offsets])]
+        sentence_spans = SpanSet.from_spans(response_context.sentence_offset_mapper(datapoint['sentence']).map_all(sentence_alignments_flattened))
         
         # include also already aligned (we want to include also the contextualized version to avoid incomplete sentences)
-        sentence_alignments_flattened.extend(eval(datapoint['factOffsets']))
-        sentence_alignments_flattened = dedup_and_sort_spans(sentence_alignments_flattened)
-        context_alignments_flattened = dedup_and_sort_spans(context_alignments_flattened)
+        sentence_spans = sentence_spans.union(SpanSet.from_spans(parse_offsets(datapoint['factOffsets'])))
+        context_spans = SpanSet.from_spans(context_alignments_flattened).normalize()
         
-        all_alignments = sentence_alignments_flattened + context_alignments_flattened
-        all_alignments = dedup_and_sort_spans(all_alignments)
+        all_alignments = sentence_spans.union(context_spans).to_spans()
 
         return all_alignments, tokenized_text_to_align
      
@@ -131,33 +272,36 @@ def main(task, split, results, args):
         logger.info(f"Technique: {technique}")
 
         results_path = get_decontextualized_path(split, task, technique)
-        responses_path = f'results/{split}/{task}/{technique}/{DECONTEXTUALIZED_FACTS_IDENTIFIER}_responses.csv'
+        responses_path = f'results/{split}/{task}/{technique}/{DECONTEXTUALIZED_FACTS_IDENTIFIER}_responses.jsonl'
 
-        if os.path.exists(results_path):
+        if intermediate_exists(results_path):
             logger.info(f"Decontextualized facts results path {results_path} exists, skipping...")
             continue
 
         facts_path = get_facts_path(split, task, technique)
-        facts_df = pd.read_csv(facts_path)
+        facts_df = read_intermediate(facts_path)
         
+        # keep only sampled facts to avoid large overhead
+        facts_df = facts_df[facts_df['is_sampled']]
+        
+        registry = technique_obj['registry']
         datapoints = []
         for _, fact_row in facts_df.iterrows():
-            instance = [x for x in technique_obj['results'] if x['unique_id'] == fact_row['unique_id']][0]
+            instance = registry.instance(fact_row['unique_id'])
             
             datapoint = decontextualize_facts.get_datapoint(fact_row, instance['response'])
             datapoints.append(datapoint)
-        
-        # keep only sampled facts to avoid large overhead
-        datapoints = [datapoint for datapoint in datapoints if datapoint['is_sampled']]
 
-        results_and_responses = [decontextualize_facts.decontextualize(datapoint) for datapoint in tqdm(datapoints)]
-        results = pd.concat([result_and_response['results'] for result_and_response in results_and_responses])
-        responses = pd.DataFrame([{k: json.dumps(v) if isinstance(v, dict) else v for k, v in result_and_response.items() if k != 'results'} for result_and_response in results_and_responses])
+        journal = Journal(get_journal_path(results_path))
+        with ResponseLog(responses_path) as response_log:
+            results = pd.concat(decontextualize_facts.decontextualize_all(datapoints, journal=journal, response_log=response_log))
 
-        def save_func(results, responses):
-            logging.info(f"Saving decontextualized facts to {results_path}")
-            results.to_csv(results_path, index=False)
+        def save_func(results):
+            saved_path = write_intermediate(results, results_path, args.intermediate_format)
+            logging.info(f"Saved decontextualized facts to {saved_path}")
             
-            responses.to_csv(responses_path, index=False)
-            
-        save_func(results, responses)
+        save_func(results)
+        journal.remove()
+
+    logger.info(f"Tokenization cache: {get_span_tokenizer().stats()}")
+    logger.info(f"Lemmatization cache: {decontextualize_facts.fact_to_output_attribution.lemmatizer.stats()}")
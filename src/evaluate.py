@@ -1,5 +1,4 @@
 import logging
-import os
 from typing import List
 from string import punctuation
 import pandas as pd
@@ -8,6 +7,9 @@ from src.consts import *
 from src.decompose_to_facts import get_facts_path
 from src.decontextualize_facts import get_decontextualized_path
 from src.inference.factory import Factory
+from src.inference.utils import run_concurrently
+from src.intermediate_io import intermediate_exists, parse_offsets, read_intermediate, write_intermediate
+from src.journal import Journal, content_key, get_journal_path
 from src.laquer_methods.run_laquer_method import get_laquer_method_results_path
 
 logger = logging.getLogger(__name__)
@@ -16,8 +18,6 @@ logger = logging.getLogger(__name__)
 def extract_document_attribution_from_rows(rows, documents) -> str:
     any_row = rows.iloc[0]
     
-    rows['docSpanOffsets'].apply(lambda offsets: eval(offsets) if isinstance(offsets, str) else offsets)
-    
     document_file = any_row['documentFile']
     if not document_file or pd.isna(document_file):
         return None
@@ -27,7 +27,7 @@ def extract_document_attribution_from_rows(rows, documents) -> str:
         attribution = [doc for doc_id, doc in documents.items() if doc_id == document_file][0]
     else:
         # order by docSpanOffset's first subspan
-        rows['docSpanOffsets'] = rows['docSpanOffsets'].apply(lambda offsets: eval(offsets) if isinstance(offsets, str) else offsets)
+        rows['docSpanOffsets'] = rows['docSpanOffsets'].apply(parse_offsets)
         rows['first_subspan_offset'] = rows['docSpanOffsets'].apply(lambda offsets: offsets[0][0])
         rows = rows.sort_values(by='first_subspan_offset')
         doc_spans = rows['docSpanText'].apply(lambda text: " ".join(text.split(HIGHLIGHT_SEP)).strip()).tolist()
@@ -48,9 +48,8 @@ def extract_fact_attribution_from_rows(rows, documents) -> dict:
         return attribution.to_dict()
 
 
-def handle_fact(rows, documents, facts_df, entailment_model) -> bool:
+def handle_fact(rows, curr_documents, instance_facts_df, entailment_model) -> bool:
     any_row = rows.iloc[0]
-    curr_documents = documents[any_row['topic']]
     attribution = extract_fact_attribution_from_rows(rows, curr_documents)
     
     attribution = [attributed_doc_text for doc_id, attributed_doc_text in attribution.items() if attributed_doc_text is not None]
@@ -59,14 +58,14 @@ def handle_fact(rows, documents, facts_df, entailment_model) -> bool:
         return False
     
     premise = '\n '.join([attributed_doc_text.replace('\n', ' ') for attributed_doc_text in attribution])
-    hypothesis = facts_df[(facts_df['unique_id'] == any_row['topic']) & (facts_df['fact_idx'] == int(any_row['fact_idx']))]['fact'].values[0]
+    hypothesis = instance_facts_df[instance_facts_df['fact_idx'] == int(any_row['fact_idx'])]['fact'].values[0]
 
     entailment_result, _ = entailment_model.generate_entailment_decision(premise_text=premise, hypothesis_text=hypothesis)
     return entailment_result
     
 
-def handle_instance(rows, documents, facts_df, entailment_model):
-    instance_results = rows.groupby('fact_idx').apply(handle_fact, documents, facts_df, entailment_model)
+def handle_instance(rows, curr_documents, instance_facts_df, entailment_model):
+    instance_results = rows.groupby('fact_idx').apply(handle_fact, curr_documents, instance_facts_df, entailment_model)
     instance_results.name = 'entailment_result'
     return instance_results.reset_index()
 
@@ -88,25 +87,42 @@ def main(task: str, split: str, results, args, laquer_method_name: str):
             else:
                 raise ValueError(f"Unknown facts method: {facts_file_for_evaluation}")
             
-            if not os.path.exists(facts_path):
+            if not intermediate_exists(facts_path):
                 logging.info(f"Facts path {facts_path} does not exist, skipping...")
                 continue
 
-            facts_df = pd.read_csv(facts_path)            
+            facts_df = read_intermediate(facts_path)            
 
-            documents = technique_obj['documents']
+            registry = technique_obj['registry']
+            registry.add_facts(facts_file_for_evaluation, facts_df)
 
             results_output_file_path = get_laquer_method_results_path(split, task, technique, laquer_method_name)
-            laquer_method_results = pd.read_csv(results_output_file_path)
+            laquer_method_results = read_intermediate(results_output_file_path)
+            
+            # each instance is journaled once evaluated, so a restart only evaluates the remaining ones
+            def instance_key(topic_and_rows):
+                topic, rows = topic_and_rows
+                return content_key([topic, rows.to_json(), registry.instance_facts(facts_file_for_evaluation, topic).to_json()])
+            
+            journal = Journal(get_journal_path(get_evaluation_results_path(split, task, technique, facts_file_for_evaluation)), key_func=instance_key)
+            topics_and_rows = list(laquer_method_results.groupby('topic'))
             
-            entailment_results = laquer_method_results.groupby(['topic']).apply(lambda rows: handle_instance(rows, documents, facts_df, entailment_model)).reset_index()
+            def evaluate_instance(topic_and_rows):
+                topic, rows = topic_and_rows
+                return handle_instance(rows, registry.instance_documents(topic), registry.instance_facts(facts_file_for_evaluation, topic), entailment_model)
             
-            save_func(entailment_results, split, task, technique, facts_file_for_evaluation)
+            instances_results = run_concurrently(evaluate_instance, topics_and_rows, desc="Evaluating instances", journal=journal)
+            entailment_results = pd.concat(instances_results, keys=[topic for topic, _ in topics_and_rows], names=['topic', None]).reset_index()
+            
+            save_func(entailment_results, split, task, technique, facts_file_for_evaluation, args.intermediate_format)
+            journal.remove()
             print_results(entailment_results, facts_file_for_evaluation)
 
-def save_func(results, split, task, technique, facts_file_for_evaluation):
-    evaluation_results_file_path = f"results/{split}/{task}/{technique}/{facts_file_for_evaluation}__evaluation_results.csv"
-    results.to_csv(evaluation_results_file_path, index=False)
+def get_evaluation_results_path(split, task, technique, facts_file_for_evaluation):
+    return f"results/{split}/{task}/{technique}/{facts_file_for_evaluation}__evaluation_results.csv"
+
+def save_func(results, split, task, technique, facts_file_for_evaluation, intermediate_format: str = CSV_INTERMEDIATE_FORMAT):
+    evaluation_results_file_path = write_intermediate(results, get_evaluation_results_path(split, task, technique, facts_file_for_evaluation), intermediate_format)
     logging.info(f"Saved evaluation results to {evaluation_results_file_path}")
     
 def print_results(results, facts_file_for_evaluation: str):
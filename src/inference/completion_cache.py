@@ -0,0 +1,157 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+from collections import defaultdict
+from time import time
+from typing import Any, Callable, List, Optional
+
+from src.consts import LLM_CACHE_MODES, LLM_CACHE_READ_ONLY_MODE, LLM_CACHE_READ_WRITE_MODE
+
+
+logger = logging.getLogger(__name__)
+
+
+def completion_cache_key(model: str, messages: List[dict], generation_params: dict) -> str:
+    """
+    Content hash of everything that determines the completion
+    """
+
+    payload = json.dumps({"model": model, "messages": messages, "generation_params": generation_params}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class CompletionCache:
+    """
+    On-disk (SQLite) cache of LLM completions, keyed by a hash of the model, messages and generation parameters.
+    Shared by the threads of `run_concurrently`, and counts hits and misses per stage (e.g., "factscore", "molecular", "llm").
+
+    mode:
+        "read_write" - return cached completions, and store new ones
+        "read_only" - return cached completions, never write (the database is not modified)
+        "bypass" - always call the provider
+    max_entries, max_age_days:
+        Eviction when opening in read_write mode, completions older than max_age_days are removed,
+        and then the least recently used ones beyond max_entries
+    """
+
+    def __init__(self, path: str, mode: str = LLM_CACHE_READ_WRITE_MODE, max_entries: Optional[int] = None, max_age_days: Optional[float] = None):
+        if mode not in LLM_CACHE_MODES:
+            raise ValueError(f"Unknown LLM cache mode {mode}")
+
+        self.path = path
+        self.mode = mode
+        self.lock = threading.Lock()
+        self.hits = defaultdict(int)
+        self.misses = defaultdict(int)
+        self.connection = None
+
+        if mode == LLM_CACHE_READ_WRITE_MODE:
+            if os.path.dirname(path) != '':
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.connection = sqlite3.connect(path, check_same_thread=False)
+            self.connection.execute("CREATE TABLE IF NOT EXISTS completions (key TEXT PRIMARY KEY, model TEXT, response TEXT, created_at REAL, last_access REAL)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS completions_last_access ON completions (last_access)")
+            self.connection.commit()
+            self.evict(max_entries=max_entries, max_age_days=max_age_days)
+        elif mode == LLM_CACHE_READ_ONLY_MODE:
+            if os.path.exists(path):
+                self.connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+            else:
+                logger.warning(f"LLM cache {path} does not exist, all completions will be generated")
+
+    def evict(self, max_entries: Optional[int] = None, max_age_days: Optional[float] = None):
+        with self.lock:
+            num_before = self.connection.execute("SELECT COUNT(*) FROM completions").fetchone()[0]
+            if max_age_days is not None:
+                self.connection.execute("DELETE FROM completions WHERE created_at < ?", (time() - max_age_days * 24 * 60 * 60,))
+            if max_entries is not None:
+                self.connection.execute("DELETE FROM completions WHERE key NOT IN (SELECT key FROM completions ORDER BY last_access DESC LIMIT ?)", (max_entries,))
+            self.connection.commit()
+            num_after = self.connection.execute("SELECT COUNT(*) FROM completions").fetchone()[0]
+
+        if num_before != num_after:
+            logger.info(f"Evicted {num_before - num_after} completions from the LLM cache {self.path}")
+
+    def get(self, key: str) -> Optional[dict]:
+        if self.connection is None:
+            return None
+
+        with self.lock:
+            row = self.connection.execute("SELECT response FROM completions WHERE key = ?", (key,)).fetchone()
+            if row is not None and self.mode == LLM_CACHE_READ_WRITE_MODE:
+                self.connection.execute("UPDATE completions SET last_access = ? WHERE key = ?", (time(), key))
+                self.connection.commit()
+
+        return json.loads(row[0]) if row is not None else None
+
+    def put(self, key: str, model: str, response: dict):
+        if self.mode != LLM_CACHE_READ_WRITE_MODE:
+            return
+
+        now = time()
+        with self.lock:
+            self.connection.execute("INSERT OR REPLACE INTO completions (key, model, response, created_at, last_access) VALUES (?, ?, ?, ?, ?)", (key, model, json.dumps(response), now, now))
+            self.connection.commit()
+
+    def delete(self, key: str):
+        if self.mode != LLM_CACHE_READ_WRITE_MODE:
+            return
+
+        with self.lock:
+            self.connection.execute("DELETE FROM completions WHERE key = ?", (key,))
+            self.connection.commit()
+
+    def get_or_generate(self, stage: str, model: str, messages: List[dict], generation_params: dict, generate: Callable[[], dict], parse: Optional[Callable[[dict], Any]] = None):
+        """
+        The cached completion, or a new one from `generate`.
+        With `parse`, returns parse(completion), and a new completion is stored only once it parses, so a caller that retries on a parsing
+        error (see `retry_wrapper`) gets a new completion instead of the same one. A cached completion that fails to parse is removed and
+        generated again.
+        """
+
+        key = completion_cache_key(model, messages, generation_params)
+        if parse is None:
+            parse = lambda response: response
+
+        response = self.get(key)
+        if response is not None:
+            try:
+                parsed_response = parse(response)
+            except Exception:
+                logger.warning(f"A cached {stage} completion failed to parse, generating it again")
+                self.delete(key)
+            else:
+                with self.lock:
+                    self.hits[stage] += 1
+                return parsed_response
+
+        response = generate()
+        with self.lock:
+            self.misses[stage] += 1
+        parsed_response = parse(response)
+        self.put(key, model, response)
+        return parsed_response
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {stage: {"hits": self.hits[stage], "misses": self.misses[stage]} for stage in sorted(set(self.hits) | set(self.misses))}
+
+
+_completion_caches = {}
+_completion_caches_lock = threading.Lock()  # the inference wrappers are created lazily, inside the threads of `run_concurrently`
+
+
+def get_completion_cache(args) -> CompletionCache:
+    """
+    The completion cache shared by the entire process (one per path and mode, see `scripts/run_all.py` for the arguments)
+    """
+
+    key = (args.llm_cache_path, args.llm_cache_mode)
+    with _completion_caches_lock:
+        if key not in _completion_caches:
+            _completion_caches[key] = CompletionCache(args.llm_cache_path, mode=args.llm_cache_mode, max_entries=args.llm_cache_max_entries, max_age_days=args.llm_cache_max_age_days)
+
+        return _completion_caches[key]
@@ -1,5 +1,6 @@
 
 
+from typing import Optional
 from src.consts import *
 from src.inference.remote_inference_wrapper import RemoteInferenceWrapper
 from src.inference.trueteacher_entailment_model import TrueTeacherEntailmentModel
@@ -10,8 +11,9 @@ class Factory:
     Generates necessary inference models/wrappers based on the provided config.
     """
     
-    def __init__(self, args) -> None:
+    def __init__(self, args, stage: Optional[str] = None) -> None:
         self.args = args
+        self.stage = stage  # which pipeline stage the inference is for (e.g., FACTS_IDENTIFIER)
         self.cache = {}
 
 
@@ -19,7 +21,7 @@ class Factory:
         if 'inference_wrapper' in self.cache:
             return self.cache['inference_wrapper']
         
-        inference_wrapper = RemoteInferenceWrapper(self.args)
+        inference_wrapper = RemoteInferenceWrapper(self.args, stage=self.stage)
             
         self.cache['inference_wrapper'] = inference_wrapper
         
@@ -7,6 +7,8 @@ from litellm import completion
 
 logger = logging.getLogger(__name__)
 
+GENERATE_TEXT_MAX_TOKENS = 1024
+
 
 def remote_generate_text(model: str, messages: List[dict]):
     """
@@ -18,7 +20,7 @@ def remote_generate_text(model: str, messages: List[dict]):
     response = completion(
         model=model,
         messages=messages,
-        max_tokens=1024    
+        max_tokens=GENERATE_TEXT_MAX_TOKENS
     )
     
     finish_reason_value = response.choices[0].finish_reason
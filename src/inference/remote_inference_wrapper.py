@@ -1,17 +1,31 @@
-from typing import List, Optional
+from typing import Any, Callable, List, Optional
 import litellm
+from src.inference.completion_cache import get_completion_cache
 from src.inference.generate_json_object.remote_generate_json_object import remote_generate_json_object
-from src.inference.generate_text.remote_generate_text import remote_generate_text
+from src.inference.generate_text.remote_generate_text import GENERATE_TEXT_MAX_TOKENS, remote_generate_text
 
 class RemoteInferenceWrapper:
-    def __init__(self, args) -> None:
+    def __init__(self, args, stage: Optional[str] = None) -> None:
         super().__init__()
         
         self.args = args
+        self.stage = stage  # for the completion cache stats
+        self.completion_cache = get_completion_cache(args)
 
     def generate_json_object(self, messages: List[dict], generation_config: Optional[dict] = None):
         return remote_generate_json_object(self, messages, generation_config)
     
-    def generate_text(self, messages: List[dict]):
-        return remote_generate_text(self.args.model, messages)
+    def generate_text(self, messages: List[dict], parse: Optional[Callable[[dict], Any]] = None):
+        """
+        The completion, or parse(completion) if given (only completions that parse are cached, see `CompletionCache.get_or_generate`)
+        """
+        
+        return self.completion_cache.get_or_generate(
+            stage=self.stage,
+            model=self.args.model,
+            messages=messages,
+            generation_params={"max_tokens": GENERATE_TEXT_MAX_TOKENS},
+            generate=lambda: remote_generate_text(self.args.model, messages),
+            parse=parse
+        )
         
@@ -1,5 +1,10 @@
 import logging
 import random
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from time import time
+from typing import Any, Callable, List, Optional
+from tqdm import tqdm
+from src.journal import Journal
 
 
 def generate_random_seed():
@@ -30,3 +35,58 @@ def retry_wrapper(func):
         
         raise ValueError("Failed after 5 retries")  
     return retry_wrapper_inner
+
+
+def run_concurrently(func: Callable, items: List, max_concurrency: int = 1, desc: Optional[str] = None, journal: Optional[Journal] = None, callback: Optional[Callable[[int, Any], None]] = None, keep_results: bool = True) -> List:
+    """
+    Calls func on each item with up to `max_concurrency` calls in flight (threads, the calls mostly wait for the remote LLM).
+    The results are returned in the order of the items, and a failure (after func's own retries, see `retry_wrapper`) cancels the pending calls and is raised.
+    With max_concurrency=1 the items are processed one by one in the calling thread.
+    If a journal is given, items that are already in it are not processed again, and each finished item is appended to it (from the calling thread).
+    If a callback is given, it is called with (item_idx, result) from the calling thread as soon as each result is available (e.g., to start post-processing it).
+    With keep_results=False the results are only passed to the callback and not kept (the returned list is all None).
+    """
+
+    start = time()
+    results = [None] * len(items)
+    pending_idxs = list(range(len(items)))
+
+    if journal is not None:
+        journaled_results = journal.load()
+        keys = [journal.key(item) for item in items]
+        pending_idxs = [idx for idx, key in enumerate(keys) if key not in journaled_results]
+        if len(pending_idxs) < len(items):
+            logging.info(f"Resuming from {journal.path}, {len(items) - len(pending_idxs)} of {len(items)} items are already done")
+        for idx, key in enumerate(keys):
+            if key in journaled_results:
+                result = journaled_results[key]
+                if keep_results:
+                    results[idx] = result
+                if callback is not None:
+                    callback(idx, result)
+
+    def on_result(idx, result):
+        if keep_results:
+            results[idx] = result
+        if journal is not None:
+            journal.append(keys[idx], result)
+        if callback is not None:
+            callback(idx, result)
+
+    if max_concurrency <= 1:
+        for idx in tqdm(pending_idxs, desc=desc):
+            on_result(idx, func(items[idx]))
+    else:
+        with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+            future_to_idx = {executor.submit(func, items[idx]): idx for idx in pending_idxs}
+            try:
+                for future in tqdm(as_completed(future_to_idx), total=len(future_to_idx), desc=desc):
+                    on_result(future_to_idx[future], future.result())
+            except BaseException:
+                for future in future_to_idx:
+                    future.cancel()
+                raise
+    end = time()
+
+    logging.info(f"Processed {len(pending_idxs)} items in {end - start:.1f}s ({len(pending_idxs) / max(end - start, 1e-9):.2f} items/s, max concurrency {max_concurrency})")
+    return results
@@ -0,0 +1,98 @@
+import ast
+import logging
+import os
+from typing import List, Optional
+import pandas as pd
+
+from src.consts import CSV_INTERMEDIATE_FORMAT, INTERMEDIATE_FORMATS, PARQUET_INTERMEDIATE_FORMAT
+
+
+logger = logging.getLogger(__name__)
+
+# columns holding lists of (start_idx, end_idx) offsets, stored natively as lists of int pairs in Parquet
+OFFSETS_COLUMNS = ['local_factOffsets', 'factOffsets', 'docSpanOffsets']
+
+
+def parse_offsets(offsets) -> Optional[List[tuple]]:
+    """
+    The offsets of a cell as a list of (start_idx, end_idx) tuples, whether it was read from a CSV (a string such as "[(0, 5), (7, 9)]",
+    parsed as a literal, without eval) or from Parquet (arrays of int pairs). Missing values (None / NaN) are returned as is.
+    """
+
+    if isinstance(offsets, str):
+        return [tuple(offset) for offset in ast.literal_eval(offsets)]
+    if offsets is None or (isinstance(offsets, float) and pd.isna(offsets)):
+        return offsets
+    return [tuple(int(idx) for idx in offset) for offset in offsets]
+
+
+def get_intermediate_path(csv_path: str, intermediate_format: str) -> str:
+    """
+    The path of an intermediate file (given by its CSV path, e.g., `get_facts_path`) in the given format
+    """
+
+    if intermediate_format not in INTERMEDIATE_FORMATS:
+        raise ValueError(f"Unknown intermediate format {intermediate_format}")
+
+    if intermediate_format == PARQUET_INTERMEDIATE_FORMAT:
+        return f"{os.path.splitext(csv_path)[0]}.parquet"
+    return csv_path
+
+
+def intermediate_exists(csv_path: str) -> bool:
+    return any(os.path.exists(get_intermediate_path(csv_path, intermediate_format)) for intermediate_format in INTERMEDIATE_FORMATS)
+
+
+def read_intermediate(csv_path: str) -> pd.DataFrame:
+    """
+    Reads an intermediate file, from Parquet (memory mapped) if it exists, otherwise from the CSV.
+    The offsets columns of a Parquet file are returned as lists of tuples (the CSV ones stay strings, see `parse_offsets`).
+    """
+
+    parquet_path = get_intermediate_path(csv_path, PARQUET_INTERMEDIATE_FORMAT)
+    if not os.path.exists(parquet_path):
+        return pd.read_csv(csv_path)
+
+    df = pd.read_parquet(parquet_path, memory_map=True)
+    for column in OFFSETS_COLUMNS:
+        if column in df.columns:
+            df[column] = df[column].map(parse_offsets)
+    return df
+
+
+def write_intermediate(df: pd.DataFrame, csv_path: str, intermediate_format: str = CSV_INTERMEDIATE_FORMAT) -> str:
+    """
+    Writes an intermediate file in the given format.
+    In CSV, the offsets columns are written as lists of tuples of plain ints (e.g., "[(0, 5)]", which `parse_offsets` reads back).
+    In Parquet, the offsets columns are lists of int pairs, and other columns of nested python objects (e.g., factscore_missing)
+    are stringified as in the CSV.
+
+    Returns
+    -------
+    path: str
+        The path that was written
+    """
+
+    path = get_intermediate_path(csv_path, intermediate_format)
+    if intermediate_format == CSV_INTERMEDIATE_FORMAT:
+        df.assign(**{column: df[column].map(parse_offsets) for column in OFFSETS_COLUMNS if column in df.columns}).to_csv(path, index=False)
+        return path
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    offsets_type = pa.list_(pa.list_(pa.int64(), 2))
+    columns = {}
+    for column in df.columns:
+        values = df[column]
+        if column in OFFSETS_COLUMNS:
+            offsets = [parse_offsets(value) for value in values]
+            columns[column] = pa.array([[list(offset) for offset in value] if isinstance(value, list) else None for value in offsets], type=offsets_type)
+        elif values.dtype == object and values.map(lambda value: isinstance(value, (list, tuple, dict))).any():
+            # from_pandas, so the missing values (NaN, e.g., a column that only some of the concatenated frames have) are nulls
+            columns[column] = pa.array([str(value) if isinstance(value, (list, tuple, dict)) else value for value in values], from_pandas=True)
+        else:
+            columns[column] = pa.Array.from_pandas(values)
+
+    pq.write_table(pa.table(columns), path)
+    return path
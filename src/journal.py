@@ -0,0 +1,76 @@
+import hashlib
+import json
+import logging
+import os
+import pickle
+from typing import Any, Callable, Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+def get_journal_path(results_path: str) -> str:
+    return f"{os.path.splitext(results_path)[0]}.journal"
+
+
+def content_key(item) -> str:
+    return hashlib.sha256(json.dumps(item, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+class Journal:
+    """
+    Append-only journal of the finished items of a pipeline stage, so a restarted stage skips them.
+    Each record is a pickled (key, result) pair (pickle keeps tuples and DataFrames as they are), and is flushed to disk once written.
+    The stage compacts the journal into its results file at the end, and then removes it.
+
+    key_func:
+        item -> key, by default a hash of the item's content, so items whose inputs changed are not skipped
+    """
+
+    def __init__(self, path: str, key_func: Optional[Callable[[Any], str]] = None):
+        self.path = path
+        self.key_func = key_func if key_func is not None else content_key
+
+    def key(self, item) -> str:
+        return self.key_func(item)
+
+    def load(self) -> dict:
+        """
+        Returns
+        -------
+        results: dict
+            key -> result of the journaled items. A record that was partially written (the process was killed while writing it) is dropped.
+        """
+
+        results = {}
+        if not os.path.exists(self.path):
+            return results
+
+        with open(self.path, 'rb') as f:
+            valid_size = 0
+            while True:
+                try:
+                    key, result = pickle.load(f)
+                except EOFError:
+                    break
+                except (pickle.UnpicklingError, ValueError, TypeError, AttributeError, IndexError):
+                    logger.warning(f"Dropping a partially written record at the end of {self.path}")
+                    break
+                results[key] = result
+                valid_size = f.tell()
+
+        if valid_size < os.path.getsize(self.path):
+            with open(self.path, 'r+b') as f:
+                f.truncate(valid_size)
+
+        return results
+
+    def append(self, key: str, result):
+        with open(self.path, 'ab') as f:
+            pickle.dump((key, result), f)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
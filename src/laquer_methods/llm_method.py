@@ -7,8 +7,8 @@ from src.inference.factory import Factory
 from src.inference.utils import retry_wrapper
 from src.laquer_methods.llm_method_prompts import *
 from src.laquer_methods.utils import find_substring
-from src.decompose_to_facts import fix_local_offset_to_doc_offset
 from src.lexical_alignment.lexical_edit_distance_attribution import word_tokenize_with_spans
+from src.utils import OffsetMapper
 
 
 class LLMBasedAlignment:
@@ -128,6 +128,7 @@ class LLMBasedAlignment:
             raise ValueError(f"No output span found in source spans ; response['text']: {response['text']} ; sentence: {datapoint['sentence']}")
         
         alignments = []
+        source_offset_mappers = {}  # source_id -> OffsetMapper, built once per source
         for found_alignment in found_alignments:
             offset = found_alignment['offset']
             source_id = found_alignment['source_id']
@@ -144,8 +145,10 @@ class LLMBasedAlignment:
                 any_source_metadata = datapoint['source_metadata'][source_id][0]
                 doc_sent_char_idx = int(any_source_metadata['docSentCharIdx'])
                 doc_sent_text = any_source_metadata['docSentText']
-                all_sources_offsets = [offset for source_metadata in datapoint['source_metadata'][source_id] for offset in source_metadata['docSpanOffsets']]
-                offset = fix_local_offset_to_doc_offset(offset, all_sources_offsets)
+                if source_id not in source_offset_mappers:
+                    all_sources_offsets = [offset for source_metadata in datapoint['source_metadata'][source_id] for offset in source_metadata['docSpanOffsets']]
+                    source_offset_mappers[source_id] = OffsetMapper(all_sources_offsets)
+                offset = source_offset_mappers[source_id].map(offset)
             else:
                 offset = [offset]
             
@@ -164,7 +167,13 @@ class LLMBasedAlignment:
                 
 
     def extract_attribution(self, datapoint):
-        factory = Factory(self.args)
+        """
+        Returns
+        -------
+        {"results": the attributions, **response}, without the datapoint's fields (the caller has them, see `run_laquer_method.main`)
+        """
+        
+        factory = Factory(self.args, stage=LLM_LAQUER_METHOD)
 
         inference_wrapper = factory.inference_wrapper()
         prompt = self.build_prompt(datapoint)
@@ -177,23 +186,15 @@ class LLMBasedAlignment:
             response = {
                 'error': str(e)
             }
-            datapoint = datapoint.copy()
-            datapoint.pop('source_metadata')            
             return {
                 "results": results,
-                **response,
-                **datapoint
+                **response
             }
 
     @retry_wrapper
     def _extract_attribution_w_retry(self, datapoint, prompt, inference_wrapper):
-        response = inference_wrapper.generate_text(messages=[{"role": "user", "content": prompt}])
-        
-        results = self.parse_response(datapoint, response)
-        datapoint = datapoint.copy()
-        datapoint.pop('source_metadata')
-        return {
-                "results": results,
-                **response,
-                **datapoint
-            }
+        # parsed before caching, so a response that fails to parse is generated again on retry
+        return inference_wrapper.generate_text(messages=[{"role": "user", "content": prompt}], parse=lambda response: {
+                "results": self.parse_response(datapoint, response),
+                **response
+            })
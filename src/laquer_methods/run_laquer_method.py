@@ -1,15 +1,16 @@
-import json
 import logging
-import os
 import random
 import shutil
 from time import time
 import pandas as pd
-from tqdm import tqdm
 import transformers
 from collections import defaultdict
 from src.consts import *
 from src.decontextualize_facts import get_decontextualized_path
+from src.inference.utils import run_concurrently
+from src.intermediate_io import write_intermediate
+from src.journal import Journal, get_journal_path
+from src.response_log import ResponseLog
 
 
 def get_highlight_obj_source_id(highlight_obj):
@@ -79,7 +80,7 @@ def main(task: str, split: str, results, args, laquer_method_name: str):
 
         # fix formats (can be deleted if no more old_results_output_file_path exist)
         results_output_file_path = get_laquer_method_results_path(split, task, technique, laquer_method_name)
-        responses_output_file_path = f'results/{split}/{task}/{technique}/{laquer_method_name}_responses.csv'
+        responses_output_file_path = f'results/{split}/{task}/{technique}/{laquer_method_name}_responses.jsonl'
         
         def rows_to_input_obj(rows, instance_unique_id, documents):
             any_row = rows.iloc[0]
@@ -129,7 +130,7 @@ def main(task: str, split: str, results, args, laquer_method_name: str):
         
         def create_input_objs(documents):
             input_objs = []
-            for result in technique_obj['results']:
+            for result in technique_obj['results'].iter_instances(fields=['unique_id', 'set_of_highlights_in_context']):
                 curr_documents = documents[result['unique_id']]
                 curr_input_objs = pd.DataFrame(result['set_of_highlights_in_context']).groupby('fact_idx').apply(lambda rows: rows_to_input_obj(rows, result['unique_id'], curr_documents)).tolist()
                 input_objs.extend(curr_input_objs)
@@ -140,16 +141,23 @@ def main(task: str, split: str, results, args, laquer_method_name: str):
         input_objs = create_input_objs(documents=documents)
 
         transformers.set_seed(42)
-        results_and_responses = [extract_attribution(input_obj, alignment_model=laquer_model) for input_obj in tqdm(input_objs)]
+        # finished attributions are journaled, so a restart only processes the remaining ones
+        journal = Journal(get_journal_path(results_output_file_path))
+        # the responses are logged as they arrive, only the results are kept.
+        # the journal has only the results and the responses, the input fields (e.g., the source texts) are logged from the input objs
+        results = [None] * len(input_objs)
+        with ResponseLog(responses_output_file_path) as response_log:
+            def log_response(input_idx, result_and_response):
+                results[input_idx] = result_and_response['results']
+                input_obj = {k: v for k, v in input_objs[input_idx].items() if k != 'source_metadata'}
+                response_log.write(input_idx, {**{k: v for k, v in result_and_response.items() if k != 'results'}, **input_obj, 'dataset': technique_obj['dataset'], 'split': split})
+            
+            run_concurrently(lambda input_obj: extract_attribution(input_obj, alignment_model=laquer_model), input_objs, max_concurrency=args.max_concurrency, desc="Extracting attributions", journal=journal, callback=log_response, keep_results=False)
         
-        results = pd.concat([result_and_response['results'] for result_and_response in results_and_responses])
-        responses = pd.DataFrame([{k: json.dumps(v) if isinstance(v, dict) else v for k, v in result_and_response.items() if k != 'results'} for result_and_response in results_and_responses])
-        responses['dataset'] = technique_obj['dataset']
-        responses['split'] = split
+        results = pd.concat(results)
         
-        def save_func(results, responses):
-            results.to_csv(results_output_file_path, index=False)
-            
-            responses.to_csv(responses_output_file_path, index=False)
+        def save_func(results):
+            write_intermediate(results, results_output_file_path, args.intermediate_format)
             
-        save_func(results, responses)
+        save_func(results)
+        journal.remove()
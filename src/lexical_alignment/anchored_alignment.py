@@ -0,0 +1,129 @@
+from bisect import bisect_left
+from collections import Counter
+
+from src.lexical_alignment.edit_distance_utils import SUBSTITUTION, path_to_edit_ops
+
+
+def _ngrams(tokens, ngram_size):
+    return [tuple(tokens[idx:idx + ngram_size]) for idx in range(len(tokens) - ngram_size + 1)]
+
+
+def _longest_increasing_chain(candidates):
+    """
+    Longest chain of (i, j) candidates that is increasing in j (the candidates are already sorted by i)
+    """
+
+    tails = []
+    tails_candidate_idx = []
+    prev_candidate_idx = [None] * len(candidates)
+    for candidate_idx, (_, j) in enumerate(candidates):
+        pos = bisect_left(tails, j)
+        if pos > 0:
+            prev_candidate_idx[candidate_idx] = tails_candidate_idx[pos - 1]
+        if pos == len(tails):
+            tails.append(j)
+            tails_candidate_idx.append(candidate_idx)
+        else:
+            tails[pos] = j
+            tails_candidate_idx[pos] = candidate_idx
+
+    chain = []
+    candidate_idx = tails_candidate_idx[-1] if tails_candidate_idx else None
+    while candidate_idx is not None:
+        chain.append(candidates[candidate_idx])
+        candidate_idx = prev_candidate_idx[candidate_idx]
+    return chain[::-1]
+
+
+def find_anchors(s1, s2, ngram_size: int = 1):
+    """
+    Find exact-match anchors between s1 and s2, n-grams that appear exactly once in each of them (similar to patience diff).
+
+    Returns
+    -------
+    anchors: list of (i, j)
+        Matched word pairs, strictly increasing in both i and j
+    """
+
+    s1_ngrams = _ngrams(s1, ngram_size)
+    s1_counts = Counter(s1_ngrams)
+    s2_positions = {}
+    for j, ngram in enumerate(_ngrams(s2, ngram_size)):
+        s2_positions.setdefault(ngram, []).append(j)
+
+    candidates = [(i, s2_positions[ngram][0]) for i, ngram in enumerate(s1_ngrams) if s1_counts[ngram] == 1 and len(s2_positions.get(ngram, [])) == 1]
+
+    # expand the n-grams to word pairs (consecutive n-grams overlap)
+    anchors = []
+    for i, j in _longest_increasing_chain(candidates):
+        for word_offset in range(ngram_size):
+            if not anchors or (i + word_offset > anchors[-1][0] and j + word_offset > anchors[-1][1]):
+                anchors.append((i + word_offset, j + word_offset))
+    return anchors
+
+
+def anchored_edit_distance_path(s1, s2, edit_distance_path_func, ngram_size: int = 1, band: int = 10):
+    """
+    Approximate `edit_distance_path` for a short s1 (a fact) and a long s2 (the entire output).
+    Anchors are matched directly, and the DP only runs between consecutive anchors, and in a band around the first and last anchor
+    (the s1 words before / after it, plus `band` more s2 words). When there are no anchors, falls back to the full DP.
+
+    Parameters
+    ----------
+    s1, s2: sequence
+        The sequences to be analysed (lists of words)
+    edit_distance_path_func: callable
+        The edit distance implementation to run on each region, see `EDIT_DISTANCE_PATH_ENGINES`
+    ngram_size: int
+        The length of the anchors
+    band: int
+        How many s2 words to consider beyond the s1 words before the first anchor and after the last anchor
+
+    Returns
+    -------
+    distance: int
+        The cost of the composed alignment (an upper bound of the edit distance)
+    path: list of (action, i, j)
+        The cells of the composed path, relative to the entire s1 and s2
+    """
+
+    anchors = find_anchors(s1, s2, ngram_size=ngram_size)
+    if len(anchors) == 0:
+        return edit_distance_path_func(s1, s2)
+
+    distance = 0
+    path = []
+
+    def align_region(i_start, i_end, j_start, j_end):
+        region_distance, region_path = edit_distance_path_func(s1[i_start:i_end], s2[j_start:j_end])
+        path.extend((action, i + i_start, j + j_start) for action, i, j in region_path)
+        return region_distance
+
+    # before the first anchor
+    first_i, first_j = anchors[0]
+    window_start = max(0, first_j - first_i - band)
+    distance += window_start  # s2 words outside the band are skipped
+    distance += align_region(0, first_i, window_start, first_j)
+
+    for anchor_idx, (i, j) in enumerate(anchors):
+        path.append((SUBSTITUTION, i + 1, j + 1))
+        if anchor_idx + 1 < len(anchors):
+            next_i, next_j = anchors[anchor_idx + 1]
+            distance += align_region(i + 1, next_i, j + 1, next_j)
+
+    # after the last anchor
+    last_i, last_j = anchors[-1]
+    window_end = min(len(s2), last_j + 1 + len(s1) - last_i - 1 + band)
+    distance += align_region(last_i + 1, len(s1), last_j + 1, window_end)
+    distance += len(s2) - window_end
+
+    return distance, path
+
+
+def anchored_edit_distance(s1, s2, edit_distance_path_func, ngram_size: int = 1, band: int = 10):
+    """
+    Same as `anchored_edit_distance_path`, returns the edit ops in the format of `edit_distance`
+    """
+
+    distance, path = anchored_edit_distance_path(s1, s2, edit_distance_path_func, ngram_size=ngram_size, band=band)
+    return distance, path_to_edit_ops(path, s1, s2)
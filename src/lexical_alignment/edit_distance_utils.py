@@ -84,3 +84,154 @@ def edit_distance(s1, s2, transpositions=False):
             _edit_dist_step(lev, lev_steps, i + 1, j + 1, s1, s2, transpositions=transpositions)
             
     return lev[len1][len2], lev_steps[len1][len2]
+
+
+#######
+# backpointer-based variant of edit_distance
+#######
+
+# backpointer codes, the order matches the tie-breaking order of `_edit_dist_step`
+SKIP_S1 = 0
+SKIP_S2 = 1
+SUBSTITUTION = 2
+TRANSPOSITION = 3
+
+
+def _edit_dist_backpointers(s1, s2, transpositions=False):
+    """
+    Fill the edit-distance matrix row by row, keeping only the last rows of distances and a compact backpointer matrix.
+    Ties are broken exactly like `_edit_dist_step` (skip_s1, then skip_s2, then substitution, then transposition).
+    """
+
+    len1 = len(s1)
+    len2 = len(s2)
+
+    prev_prev_row = None
+    prev_row = list(range(len2 + 1))
+    back = [None]
+    for i in range(1, len1 + 1):
+        c1 = s1[i - 1]
+        row = [i] + [0] * len2
+        back_row = bytearray(len2 + 1)
+        for j in range(1, len2 + 1):
+            c2 = s2[j - 1]
+            a = prev_row[j] + 1
+            b = row[j - 1] + 1
+            c = prev_row[j - 1] + (c1 != c2)
+            if a <= b and a <= c:
+                cheapest, action = a, SKIP_S1
+            elif b <= c:
+                cheapest, action = b, SKIP_S2
+            else:
+                cheapest, action = c, SUBSTITUTION
+
+            if transpositions and i > 1 and j > 1 and s1[i - 2] == c2 and s2[j - 2] == c1:
+                d = prev_prev_row[j - 2] + 1
+                if d < cheapest:
+                    cheapest, action = d, TRANSPOSITION
+
+            row[j] = cheapest
+            back_row[j] = action
+        back.append(back_row)
+        prev_prev_row = prev_row
+        prev_row = row
+
+    return prev_row[len2], back
+
+
+def _traceback(back, len1, len2):
+    """
+    Follow the backpointers from the last cell, returns the path as a list of (action, i, j) cells in order.
+    Like `edit_distance`, the path stops once it reaches the first row or column.
+    """
+
+    path = []
+    i, j = len1, len2
+    while i > 0 and j > 0:
+        action = back[i][j]
+        path.append((action, i, j))
+        if action == SKIP_S1:
+            i -= 1
+        elif action == SKIP_S2:
+            j -= 1
+        elif action == SUBSTITUTION:
+            i -= 1
+            j -= 1
+        else:
+            i -= 2
+            j -= 2
+    path.reverse()
+    return path
+
+
+def path_to_edit_ops(path, s1, s2):
+    """
+    Convert a traceback path to the list of edit ops returned by `edit_distance`
+    """
+
+    edit_ops = []
+    for action, i, j in path:
+        c1 = s1[i - 1]
+        c2 = s2[j - 1]
+        if action == SKIP_S1:
+            edit_ops.append({'action': 'skip_s1', 'c1': c1, 'c2': c2, 'i': i-1, 'j': j})
+        elif action == SKIP_S2:
+            edit_ops.append({'action': 'skip_s2', 'c1': c1, 'c2': c2, 'i': i, 'j': j-1})
+        elif action == SUBSTITUTION:
+            edit_ops.append({'action': 'sub' if (c1 != c2) else 'no-op', 'c1': c1, 'c2': c2, 'i': i-1, 'j': j-1})
+        else:
+            edit_ops.append({'action': 'transposition', 'c1': c1, 'c2': c2, 'i': i-2, 'j': j-2})
+    return edit_ops
+
+
+def path_to_word_alignments(path, s1, s2):
+    """
+    For each word of s1, the index of the s2 word it was matched with (a "no-op" edit op), or None if it was not matched.
+    Same decision as looking for a "no-op" among the edit ops of the word, without building the edit ops.
+    """
+
+    word_alignments = [None] * len(s1)
+    for action, i, j in path:
+        if action == SUBSTITUTION and s1[i - 1] == s2[j - 1]:
+            word_alignments[i - 1] = j - 1
+    return word_alignments
+
+
+def edit_distance_path(s1, s2, transpositions=False):
+    """
+    The edit distance and the traceback path of `edit_distance_with_backpointers`
+
+    Returns
+    -------
+    distance: int
+    path: list of (action, i, j)
+        The cells of the cheapest path in order, see `path_to_edit_ops` and `path_to_word_alignments`
+    """
+
+    distance, back = _edit_dist_backpointers(s1, s2, transpositions=transpositions)
+    return distance, _traceback(back, len(s1), len(s2))
+
+
+def edit_distance_with_backpointers(s1, s2, transpositions=False):
+    """
+    Same output as `edit_distance`, but instead of keeping a full copy of the edit ops for every cell of the matrix,
+    only a backpointer per cell is kept and the edit ops are rebuilt once with a single traceback.
+    Memory is O(len(s1) * len(s2)) bytes instead of O(len(s1) * len(s2) * (len(s1) + len(s2))) dicts.
+
+    Parameters
+    ----------
+    s1, s2: sequence
+        The sequences to be analysed (strings or lists of words)
+    transpositions: bool
+        Whether to allow transposition edits
+
+    Returns
+    -------
+    distance: int
+        The edit distance between s1 and s2
+    edit_ops: list of dict
+        The edit ops of the cheapest path, identical to the ones returned by `edit_distance`
+    """
+
+    distance, path = edit_distance_path(s1, s2, transpositions=transpositions)
+    return distance, path_to_edit_ops(path, s1, s2)
@@ -0,0 +1,102 @@
+from collections import OrderedDict
+from typing import List
+import spacy
+
+from src.consts import LOOKUP_LEMMA_BACKEND, SPACY_LEMMA_BACKEND
+
+
+class Lemmatizer:
+    """
+    Lemmatizes isolated words (each word is lemmatized on its own, as in `lexical_alignment`).
+    Unseen words are sent through `nlp.pipe` in batches, and word -> lemma is memoized in a bounded LRU cache,
+    so the same instance can be shared across facts, sentences and stages.
+    """
+
+    def __init__(self, nlp, max_cache_size: int = 100000, batch_size: int = 256):
+        self.nlp = nlp
+        self.max_cache_size = max_cache_size
+        self.batch_size = batch_size
+        self.cache = OrderedDict()
+        self.num_requested_words = 0
+        self.num_processed_words = 0
+        self.num_batches = 0
+
+    def lemmatize(self, words: List[str]) -> List[str]:
+        self.num_requested_words += len(words)
+
+        cache = self.cache
+        missing_words = list(dict.fromkeys(word for word in words if word not in cache))
+        if len(missing_words) > 0:
+            for word, doc in zip(missing_words, self.nlp.pipe(missing_words, batch_size=self.batch_size)):
+                cache[word] = ''.join(token.lemma_ for token in doc)
+            self.num_processed_words += len(missing_words)
+            self.num_batches += 1
+
+        lemmas = []
+        for word in words:
+            lemmas.append(cache[word])
+            cache.move_to_end(word)
+
+        while len(cache) > self.max_cache_size:
+            cache.popitem(last=False)
+
+        return lemmas
+
+    def stats(self) -> dict:
+        return {
+            "requested_words": self.num_requested_words,
+            "processed_words": self.num_processed_words,
+            "saved_pipeline_calls": self.num_requested_words - self.num_processed_words,
+            "batches": self.num_batches,
+            "cache_size": len(self.cache)
+        }
+
+
+_lemmatizers = {}
+
+
+def load_lemma_nlp(backend: str = SPACY_LEMMA_BACKEND, model_name: str = "en_core_web_sm"):
+    """
+    Load the spacy pipeline used for lemmatizing isolated words.
+    
+    backend:
+        "spacy" - the trained pipeline, with only the components needed for lemmatization (tok2vec, tagger, attribute_ruler, lemmatizer)
+        "lookup" - a blank pipeline with a lookup-table lemmatizer, no neural components (requires `spacy-lookups-data`).
+            The tagger has almost no context when lemmatizing a single word, so the lookup table is usually close, see `scripts/compare_lemma_backends.py`
+    """
+
+    if backend == SPACY_LEMMA_BACKEND:
+        return spacy.load(model_name, enable=['tok2vec', 'tagger', 'attribute_ruler', 'lemmatizer'])
+    elif backend == LOOKUP_LEMMA_BACKEND:
+        nlp = spacy.blank("en")
+        nlp.add_pipe("lemmatizer", config={"mode": "lookup"})
+        nlp.initialize()
+        return nlp
+    else:
+        raise ValueError(f"Unknown lemma backend {backend}")
+
+
+def get_lemmatizer(backend: str = SPACY_LEMMA_BACKEND, model_name: str = "en_core_web_sm") -> Lemmatizer:
+    """
+    The lemmatizer shared by the entire process (loads the pipeline once per backend)
+    """
+
+    key = (backend, model_name)
+    if key not in _lemmatizers:
+        _lemmatizers[key] = Lemmatizer(load_lemma_nlp(backend, model_name))
+
+    return _lemmatizers[key]
+
+
+def as_lemmatizer(nlp) -> Lemmatizer:
+    """
+    `lexical_alignment` accepts either a Lemmatizer or a spacy language model, in which case a lemmatizer is created once per model
+    """
+
+    if isinstance(nlp, Lemmatizer):
+        return nlp
+
+    key = ('nlp', id(nlp))
+    if key not in _lemmatizers or _lemmatizers[key].nlp is not nlp:
+        _lemmatizers[key] = Lemmatizer(nlp)
+    return _lemmatizers[key]
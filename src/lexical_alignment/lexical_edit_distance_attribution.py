@@ -1,35 +1,69 @@
 import logging
-from nltk.tokenize import NLTKWordTokenizer
+from typing import List
 
-from src.lexical_alignment.edit_distance_utils import edit_distance
+from src.consts import BIT_PARALLEL_ALIGNMENT_ENGINE, NUMPY_ALIGNMENT_ENGINE, PYTHON_ALIGNMENT_ENGINE
+from src.lexical_alignment.anchored_alignment import anchored_edit_distance_path
+from src.lexical_alignment.edit_distance_utils import edit_distance_path, edit_distance_with_backpointers, path_to_word_alignments
+from src.lexical_alignment.lemmatization import as_lemmatizer
+from src.lexical_alignment.tokenization import get_span_tokenizer
+from src.lexical_alignment.vectorized_edit_distance import Vocabulary, bit_parallel_ids_path, edit_distance_bit_parallel, edit_distance_numpy, numpy_ids_path
+
+
+EDIT_DISTANCE_ENGINES = {
+    PYTHON_ALIGNMENT_ENGINE: edit_distance_with_backpointers,
+    NUMPY_ALIGNMENT_ENGINE: edit_distance_numpy,
+    BIT_PARALLEL_ALIGNMENT_ENGINE: edit_distance_bit_parallel,
+}
+
+# same engines, over interned token ids (see `TokenizedText`), returning the traceback path instead of the edit ops
+EDIT_DISTANCE_PATH_ENGINES = {
+    PYTHON_ALIGNMENT_ENGINE: edit_distance_path,
+    NUMPY_ALIGNMENT_ENGINE: numpy_ids_path,
+    BIT_PARALLEL_ALIGNMENT_ENGINE: bit_parallel_ids_path,
+}
 
 
 def word_tokenize_with_spans(text):
     """
     word_tokenize loses the original word's indices, we need to keep them.
-    Instead, use the span_tokenizer
+    Instead, use the span_tokenizer (shared by the process, and memoizes recently seen texts)
     """
 
-    span_generator = NLTKWordTokenizer().span_tokenize(text)
-    spans = [(text[span[0]:span[1]], span) for span in span_generator]
-    return spans
+    return get_span_tokenizer().tokenize(text)
 
 
-def get_last_edit_op_based_on_i_idx(i, edit_ops):
+class TokenizedText:
     """
-    In edit ops, we can't rely on idx because sometimes a single word in the left-side (indices i) has multiple operations (because for example it replaced many words). So we need to look at all `i` location ops.
+    A text prepared for the lexical alignment: tokenized (lowercased), optionally lemmatized, and interned.
+    Preparing the sentence once lets it be aligned with many fact texts (or many passes of the same fact) without repeating the work.
+    
+    Parameters
+    ----------
+    text: str
+    lemmatizer: Lemmatizer or spacy language model
+        If given, the words are lemmatized before being interned
+    vocabulary: Vocabulary
+        Texts that are aligned with each other must share the same vocabulary
     """
-    all_relevant_ops = []
-    for edit_op in edit_ops:
-        if edit_op['i'] == i:
-            all_relevant_ops.append(edit_op)
-    return all_relevant_ops
 
+    def __init__(self, text: str, lemmatizer = None, vocabulary: Vocabulary = None):
+        self.text = text
+        self.is_lemmatized = lemmatizer is not None
+        self.spans = word_tokenize_with_spans(text.lower())
+        self.words = [span[0] for span in self.spans]
+        self.tokens = as_lemmatizer(lemmatizer).lemmatize(self.words) if self.is_lemmatized else self.words
+        assert len(self.tokens) == len(self.words)
+        self.vocabulary = vocabulary if vocabulary is not None else Vocabulary()
+        self.ids = self.vocabulary.intern(self.tokens)
 
-def lexical_alignment_recursively(sentence: str, fact_text: str, should_run_lemmatization: bool = False, nlp = None, stop_words = None):
+
+def lexical_alignment_recursively(sentence: str, fact_text: str, should_run_lemmatization: bool = False, nlp = None, stop_words = None, engine: str = PYTHON_ALIGNMENT_ENGINE, anchored: bool = False):
     """
     Recursively attribute until no new alignments are found
     
+    The sentence is tokenized and lemmatized once (it can also be given as a `TokenizedText`), and each pass realigns only the missing words.
+    The `engine` and `anchored` arguments are passed to `lexical_alignment`.
+    
     return
     -------
     new_alignments: dict
@@ -38,6 +72,9 @@ def lexical_alignment_recursively(sentence: str, fact_text: str, should_run_lemm
         the tokenized text with spans for the original fact_text
     """
     
+    if not isinstance(sentence, TokenizedText):
+        sentence = TokenizedText(sentence, lemmatizer=nlp if should_run_lemmatization else None)
+    
     tokenized_text_to_align = word_tokenize_with_spans(fact_text)
     new_alignments = {word_idx: [] for word_idx in range(len(tokenized_text_to_align))}
     num_missing = len(new_alignments)
@@ -49,7 +86,7 @@ def lexical_alignment_recursively(sentence: str, fact_text: str, should_run_lemm
     
     new_alignments = {}
     while num_missing > 0:
-        curr_alignments = lexical_alignment(sentence=sentence, fact_text=fact_text, should_run_lemmatization=should_run_lemmatization, nlp=nlp)
+        curr_alignments = lexical_alignment(sentence=sentence, fact_text=fact_text, should_run_lemmatization=should_run_lemmatization, nlp=nlp, engine=engine, anchored=anchored)
         
         for word_idx, is_aligned in curr_alignments.items():
             try:
@@ -87,19 +124,44 @@ def lexical_alignment_recursively(sentence: str, fact_text: str, should_run_lemm
     
     return new_alignments, tokenized_text_to_align
 
-def lexical_alignment(sentence, fact_text, should_run_lemmatization: bool = False, nlp = None):
+def lexical_alignment_batch(sentence, fact_texts: List[str], should_run_lemmatization: bool = False, nlp = None, stop_words = None, engine: str = PYTHON_ALIGNMENT_ENGINE, anchored: bool = False):
+    """
+    Align many facts with the same sentence. The sentence is tokenized, lemmatized and interned once for the entire batch,
+    and the words of all the facts are lemmatized together. Same results as calling `lexical_alignment_recursively` per fact.
+    
+    return
+    -------
+    list of (new_alignments, tokenized_text_to_align), one per fact text (see `lexical_alignment_recursively`)
+    """
+    
+    lemmatizer = as_lemmatizer(nlp) if should_run_lemmatization else None
+    if lemmatizer is not None:
+        lemmatizer.lemmatize([span[0] for fact_text in fact_texts for span in word_tokenize_with_spans(fact_text.lower())])
+    
+    if not isinstance(sentence, TokenizedText):
+        sentence = TokenizedText(sentence, lemmatizer=lemmatizer)
+    
+    return [lexical_alignment_recursively(sentence=sentence, fact_text=fact_text, should_run_lemmatization=should_run_lemmatization, nlp=lemmatizer, stop_words=stop_words, engine=engine, anchored=anchored) for fact_text in fact_texts]
+
+def lexical_alignment(sentence, fact_text, should_run_lemmatization: bool = False, nlp = None, engine: str = PYTHON_ALIGNMENT_ENGINE, anchored: bool = False):
     """
     Calculate lexical alignment between sentence and fact_text using edit distance.
     Parameters
     ----------
-    sentence: str
-        The original sentence
+    sentence: str or TokenizedText
+        The original sentence (can be prepared once with `TokenizedText`, using the same lemmatizer)
     fact_text: str
         The fact text to align to the sentence
     should_run_lemmatization: bool
         Whether to run lemmatization before calculating edit distance
-    nlp: spacy language model
-        The spacy language model to use for lemmatization
+    nlp: Lemmatizer or spacy language model
+        The lemmatizer to use (see `src.lexical_alignment.lemmatization`)
+    engine: str
+        The edit distance implementation to use, all engines return the same alignments.
+        "python" (pure python, backpointers), "numpy" (row-vectorized over interned tokens) or "bit_parallel" (Myers/Hyyrö bit vectors, fastest for long sentences)
+    anchored: bool
+        Whether to first match words that appear once in both texts, and run the edit distance only between them (see `anchored_edit_distance_path`).
+        Useful when the sentence is much longer than the fact (e.g., the entire output), but may change the alignments.
         
     Returns
     -------
@@ -107,52 +169,29 @@ def lexical_alignment(sentence, fact_text, should_run_lemmatization: bool = Fals
         word_idx -> True/False (is aligned or not)
     """
     
-    text_after = fact_text
-
+    parent = sentence if isinstance(sentence, TokenizedText) else TokenizedText(sentence, lemmatizer=nlp if should_run_lemmatization else None)
+    assert parent.is_lemmatized == should_run_lemmatization, "the sentence was prepared with a different lemmatization setting"
+    
     # calc edit distance and operations
-    tokenized_text_with_span_after = word_tokenize_with_spans(text_after.lower())
-    tokenized_text_after = [x[0] for x in tokenized_text_with_span_after]
+    fact = TokenizedText(fact_text, lemmatizer=nlp if should_run_lemmatization else None, vocabulary=parent.vocabulary)
 
-    
     logging.debug('start calculating edit distance between sentence and fact')
 
-    parent_text = sentence
-
-    parent_alignment = word_tokenize_with_spans(parent_text.lower())
-
-
-    word_tokenized_parent = [x[0] for x in parent_alignment]
-
+    edit_distance_path_func = EDIT_DISTANCE_PATH_ENGINES[engine]
+    if anchored:
+        edit_dist, edit_path = anchored_edit_distance_path(fact.ids, parent.ids, edit_distance_path_func=edit_distance_path_func)
+    else:
+        edit_dist, edit_path = edit_distance_path_func(fact.ids, parent.ids)
     
-    if should_run_lemmatization:
-        tokenized_text_after_lemmatized = [''.join(y.lemma_ for y in nlp(x)) for x in tokenized_text_after]
-        word_tokenized_parent_lemmatized = [''.join(y.lemma_ for y in nlp(x)) for x in word_tokenized_parent]
-        assert len(tokenized_text_after_lemmatized) == len(tokenized_text_after)
-        assert len(word_tokenized_parent_lemmatized) == len(word_tokenized_parent)
-        tokenized_text_after = tokenized_text_after_lemmatized
-        word_tokenized_parent = word_tokenized_parent_lemmatized
-    
-    edit_dist, edit_ops = edit_distance(tokenized_text_after, word_tokenized_parent)
-    
-    def get_parent_alignments(word_idx):
-        # map word idx to the parent's word idx
-        relevant_edit_ops = get_last_edit_op_based_on_i_idx(word_idx, edit_ops)
-        edit_op = [edit_op for edit_op in relevant_edit_ops if edit_op['action'] == 'no-op'][0]
-        parent_word_idx = edit_op['j']
-        
-        return parent_alignment[parent_word_idx]
-
+    # map word idx to the parent's word idx (None if the word changed)
+    parent_word_idxs = path_to_word_alignments(edit_path, fact.ids, parent.ids)
     
     alignments = {}
 
-    for word_idx, word in enumerate(tokenized_text_after):
-        did_word_change = []
-        curr_edit_ops = get_last_edit_op_based_on_i_idx(word_idx, edit_ops)
-        did_word_change.append('no-op' not in [edit_op['action'] for edit_op in curr_edit_ops])
-
-        is_aligned = sum(did_word_change) == 0
+    for word_idx, parent_word_idx in enumerate(parent_word_idxs):
+        is_aligned = parent_word_idx is not None
         if is_aligned:
-            alignments[word_idx] = get_parent_alignments(word_idx)
+            alignments[word_idx] = parent.spans[parent_word_idx]
         else:
             alignments[word_idx] = None
             
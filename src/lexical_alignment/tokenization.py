@@ -0,0 +1,62 @@
+import threading
+from collections import OrderedDict
+from nltk.tokenize import NLTKWordTokenizer
+
+
+class SpanTokenizer:
+    """
+    Word tokenizer that keeps the original offsets of the words.
+    The NLTK tokenizer is built once, and the tokenizations of recently seen texts are memoized in a bounded LRU cache,
+    since the alignment tokenizes the same sentences and facts many times.
+    The cache is shared by the threads of `run_concurrently` (e.g., the LLM-LAQuer method parses its responses in them), so it is
+    guarded by a lock, the tokenization itself runs outside of it.
+    """
+
+    def __init__(self, max_cache_size: int = 10000):
+        self.tokenizer = NLTKWordTokenizer()
+        self.max_cache_size = max_cache_size
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def tokenize(self, text: str) -> list:
+        """
+        Returns
+        -------
+        spans: list of (word, (start_idx, end_idx))
+        """
+
+        with self.lock:
+            spans = self.cache.get(text)
+            if spans is not None:
+                self.hits += 1
+                self.cache.move_to_end(text)
+                return list(spans)
+            self.misses += 1
+
+        spans = tuple((text[start:end], (start, end)) for start, end in self.tokenizer.span_tokenize(text))
+        with self.lock:
+            self.cache[text] = spans
+            while len(self.cache) > self.max_cache_size:
+                self.cache.popitem(last=False)
+        return list(spans)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "cache_size": len(self.cache)
+            }
+
+
+_span_tokenizer = SpanTokenizer()
+
+
+def get_span_tokenizer() -> SpanTokenizer:
+    """
+    The tokenizer shared by the entire process
+    """
+
+    return _span_tokenizer
@@ -0,0 +1,209 @@
+from typing import List
+import numpy as np
+
+from src.lexical_alignment.edit_distance_utils import SKIP_S1, SKIP_S2, SUBSTITUTION, _traceback, path_to_edit_ops
+
+
+class Vocabulary:
+    """
+    Interns tokens to integer ids, so the DP compares small ints instead of strings.
+    A vocabulary can be shared between calls (for example, all facts aligned with the same sentence).
+    """
+
+    def __init__(self):
+        self.token_to_id = {}
+
+    def __len__(self):
+        return len(self.token_to_id)
+
+    def intern(self, tokens) -> List[int]:
+        token_to_id = self.token_to_id
+        return [token_to_id.setdefault(token, len(token_to_id)) for token in tokens]
+
+
+def _numpy_backpointers(ids1: np.ndarray, ids2: np.ndarray):
+    """
+    Row-vectorized version of `_edit_dist_backpointers` (without transpositions).
+    The left-to-right dependency inside a row, row[j] = min(t[j], row[j-1] + 1), is a running minimum of t[k] - k, shifted back by j.
+    """
+
+    len1 = len(ids1)
+    len2 = len(ids2)
+
+    offsets = np.arange(len2 + 1)
+    prev_row = offsets.copy()
+    back = [None]
+    candidates = np.empty(len2 + 1, dtype=np.int64)
+    for i in range(1, len1 + 1):
+        up = prev_row[1:] + 1
+        diag = prev_row[:-1] + (ids2 != ids1[i - 1])
+        candidates[0] = i
+        np.minimum(up, diag, out=candidates[1:])
+        row = np.minimum.accumulate(candidates - offsets) + offsets
+
+        # same tie-breaking as `_edit_dist_step`: skip_s1, then skip_s2, then substitution
+        cheapest = row[1:]
+        left = row[:-1] + 1
+        actions = np.where(up == cheapest, SKIP_S1, np.where(left == cheapest, SKIP_S2, SUBSTITUTION))
+        back.append(b'\x00' + actions.astype(np.uint8).tobytes())
+        prev_row = row
+
+    return int(prev_row[len2]), back
+
+
+def _bit_parallel_columns(ids1, ids2):
+    """
+    Bit-parallel (Myers / Hyyrö) computation of the unit-cost edit-distance matrix.
+    The words of s1 are the bits, and each column j is kept as two bit vectors of vertical deltas:
+    bit i of pv (mv) is set when D[i+1][j] - D[i][j] is +1 (-1).
+    Python ints are used as bit vectors, so s1 can be of any length.
+    """
+
+    len1 = len(ids1)
+    mask = (1 << len1) - 1
+
+    peq = {}
+    for i, token_id in enumerate(ids1):
+        peq[token_id] = peq.get(token_id, 0) | (1 << i)
+
+    pv = mask  # column 0: D[i][0] = i
+    mv = 0
+    columns = [(pv, mv)]
+    for token_id in ids2:
+        eq = peq.get(token_id, 0)
+        xv = eq | mv
+        xh = ((((eq & pv) + pv) & mask) ^ pv) | eq
+        ph = mv | (~(xh | pv) & mask)
+        mh = pv & xh
+        # the first row is D[0][j] = j, so its horizontal delta is always +1
+        ph = ((ph << 1) | 1) & mask
+        mh = (mh << 1) & mask
+        pv = mh | (~(xv | ph) & mask)
+        mv = ph & xv
+        columns.append((pv, mv))
+
+    return columns
+
+
+def _bit_parallel_cell(columns, i, j):
+    pv, mv = columns[j]
+    below_i = (1 << i) - 1
+    return j + (pv & below_i).bit_count() - (mv & below_i).bit_count()
+
+
+def _bit_parallel_traceback(columns, ids1, ids2):
+    """
+    Same path as `_traceback`, the backpointers are recovered from the delta vectors on the fly,
+    so only the cells along the path are ever computed.
+    """
+
+    path = []
+    i, j = len(ids1), len(ids2)
+    value = _bit_parallel_cell(columns, i, j)
+    while i > 0 and j > 0:
+        pv, _ = columns[j]
+        if (pv >> (i - 1)) & 1:
+            path.append((SKIP_S1, i, j))
+            value -= 1
+            i -= 1
+            continue
+
+        left_value = _bit_parallel_cell(columns, i, j - 1)
+        if left_value + 1 == value:
+            path.append((SKIP_S2, i, j))
+            value = left_value
+            j -= 1
+        else:
+            path.append((SUBSTITUTION, i, j))
+            value -= ids1[i - 1] != ids2[j - 1]
+            i -= 1
+            j -= 1
+    path.reverse()
+    return path
+
+
+def _bit_parallel_path(ids1, ids2):
+    columns = _bit_parallel_columns(ids1, ids2)
+    distance = _bit_parallel_cell(columns, len(ids1), len(ids2))
+    return distance, _bit_parallel_traceback(columns, ids1, ids2)
+
+
+def numpy_ids_path(ids1, ids2):
+    """
+    The edit distance and traceback path (see `edit_distance_path`) of interned tokens, the DP is filled one row at a time with NumPy
+    (without transpositions).
+    """
+
+    ids1 = np.asarray(ids1, dtype=np.int64)
+    ids2 = np.asarray(ids2, dtype=np.int64)
+    distance, back = _numpy_backpointers(ids1, ids2)
+    return distance, _traceback(back, len(ids1), len(ids2))
+
+
+def bit_parallel_ids_path(ids1, ids2):
+    """
+    The edit distance and traceback path (see `edit_distance_path`) of interned tokens, using a bit-parallel DP (without transpositions).
+    It takes O(len(ids2)) big-int operations, so aligning a short fact with a long context is roughly linear in the context length.
+    """
+
+    return _bit_parallel_path(ids1, ids2)
+
+
+def edit_distance_numpy_path(s1, s2, vocabulary: Vocabulary = None):
+    """
+    Interns the tokens and runs `numpy_ids_path`
+    """
+
+    vocabulary = vocabulary if vocabulary is not None else Vocabulary()
+    return numpy_ids_path(vocabulary.intern(s1), vocabulary.intern(s2))
+
+
+def edit_distance_bit_parallel_path(s1, s2, vocabulary: Vocabulary = None):
+    """
+    Interns the tokens and runs `bit_parallel_ids_path`
+    """
+
+    vocabulary = vocabulary if vocabulary is not None else Vocabulary()
+    return bit_parallel_ids_path(vocabulary.intern(s1), vocabulary.intern(s2))
+
+
+def edit_distance_numpy(s1, s2, vocabulary: Vocabulary = None):
+    """
+    Same output as `edit_distance_with_backpointers` (without transpositions), see `edit_distance_numpy_path`.
+
+    Parameters
+    ----------
+    s1, s2: sequence
+        The sequences to be analysed (lists of words)
+    vocabulary: Vocabulary
+        Optional vocabulary to intern the tokens with, to share it between calls
+
+    Returns
+    -------
+    distance: int
+    edit_ops: list of dict
+    """
+
+    distance, path = edit_distance_numpy_path(s1, s2, vocabulary=vocabulary)
+    return distance, path_to_edit_ops(path, s1, s2)
+
+
+def edit_distance_bit_parallel(s1, s2, vocabulary: Vocabulary = None):
+    """
+    Same output as `edit_distance_with_backpointers` (without transpositions), see `edit_distance_bit_parallel_path`.
+
+    Parameters
+    ----------
+    s1, s2: sequence
+        The sequences to be analysed (lists of words)
+    vocabulary: Vocabulary
+        Optional vocabulary to intern the tokens with, to share it between calls
+
+    Returns
+    -------
+    distance: int
+    edit_ops: list of dict
+    """
+
+    distance, path = edit_distance_bit_parallel_path(s1, s2, vocabulary=vocabulary)
+    return distance, path_to_edit_ops(path, s1, s2)
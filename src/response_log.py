@@ -0,0 +1,85 @@
+import hashlib
+import json
+from typing import Iterator, Tuple
+import pandas as pd
+
+
+# serialized values at least this long are stored once, as blobs (e.g., the source texts and contexts shared by many records)
+BLOB_MIN_SIZE = 256
+
+BLOB_REFERENCE_KEY = "$blob"
+
+
+class ResponseLog:
+    """
+    Append-only JSONL log of the LLM responses of a stage, each response is written as soon as it is available instead of keeping
+    all of them (with their datapoints) until the end of the stage.
+    Large values are stored once per log, keyed by their content hash, and the records reference them, so a document or a context that
+    many records share is written once. The log has two kinds of lines:
+        {"blob": hash, "value": value} - written before the first record that references it
+        {"idx": item_idx, "record": {field: value or {"$blob": hash}}}
+    The records are written in the order they arrive, `load_response_log` orders them by their item index.
+    The log is rewritten from the start when opened (a resumed stage writes the journaled responses again).
+    """
+
+    def __init__(self, path: str, min_blob_size: int = BLOB_MIN_SIZE):
+        self.path = path
+        self.min_blob_size = min_blob_size
+        self.blob_hashes = set()
+        self.file = None
+
+    def __enter__(self):
+        self.file = open(self.path, 'w', encoding='utf-8')
+        self.blob_hashes = set()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.file.close()
+        self.file = None
+
+    def write(self, idx: int, record: dict):
+        lines = []
+        stored_record = {}
+        for field, value in record.items():
+            serialized_value = json.dumps(value, ensure_ascii=False, default=str)
+            if len(serialized_value) < self.min_blob_size:
+                stored_record[field] = value
+                continue
+
+            blob_hash = hashlib.sha256(serialized_value.encode('utf-8')).hexdigest()
+            if blob_hash not in self.blob_hashes:
+                self.blob_hashes.add(blob_hash)
+                lines.append(f'{{"blob": "{blob_hash}", "value": {serialized_value}}}')
+            stored_record[field] = {BLOB_REFERENCE_KEY: blob_hash}
+
+        lines.append(json.dumps({"idx": idx, "record": stored_record}, ensure_ascii=False, default=str))
+        self.file.write('\n'.join(lines) + '\n')
+        self.file.flush()
+
+
+def read_response_log(path: str) -> Iterator[Tuple[int, dict]]:
+    """
+    Returns
+    -------
+    iterator of (item_idx, record), with the blobs resolved, in the order they were written
+    """
+
+    blobs = {}
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            entry = json.loads(line)
+            if 'blob' in entry:
+                blobs[entry['blob']] = entry['value']
+                continue
+
+            record = {field: blobs[value[BLOB_REFERENCE_KEY]] if isinstance(value, dict) and BLOB_REFERENCE_KEY in value else value for field, value in entry['record'].items()}
+            yield entry['idx'], record
+
+
+def load_response_log(path: str) -> pd.DataFrame:
+    """
+    The records of the log as a DataFrame, one row per item in the order of the items
+    """
+
+    records = sorted(read_response_log(path), key=lambda idx_and_record: idx_and_record[0])
+    return pd.DataFrame([record for _, record in records])
@@ -0,0 +1,115 @@
+import json
+import os
+import tempfile
+import weakref
+from collections import OrderedDict
+from typing import Iterable, Iterator, List, Optional
+
+
+# parsed instances kept for the random access by unique_id (consecutive lookups are usually of the same instance)
+INSTANCES_CACHE_SIZE = 16
+
+
+def project_instance(instance: dict, fields: Optional[List[str]] = None) -> dict:
+    if fields is None:
+        return instance
+    return {field: instance[field] for field in fields if field in instance}
+
+
+class ResultsFile:
+    """
+    Lazy reader of the outputs of a technique (results.json, one JSON instance per line), so the pipeline holds at most a few parsed
+    instances at a time instead of all of them.
+    The file is scanned once to index the byte offset of each instance (by its position and by unique_id, the first instance of a repeated
+    unique_id, as `InstanceRegistry`), iterating streams the instances from disk, optionally with only the needed fields, and
+    `instance` reads a single instance with a seek.
+
+    Changes to the instances that are read are not written back to the file. A stage that changes the instances for the following stages
+    (e.g., `sentence_level_alignments_to_facts_level`) passes the changed instances to `rewrite`, the original file is not changed.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.line_offsets = []
+        self.offsets_by_id = {}
+        self.instances_cache = OrderedDict()
+        self._remove_rewritten_file = None
+
+        with open(self.path, 'rb') as f:
+            offset = 0
+            for line in f:
+                if line.strip():
+                    self.line_offsets.append((offset, len(line)))
+                    self.offsets_by_id.setdefault(json.loads(line)['unique_id'], self.line_offsets[-1])
+                offset += len(line)
+
+    def __len__(self):
+        return len(self.line_offsets)
+
+    def __iter__(self) -> Iterator[dict]:
+        return self.iter_instances()
+
+    def __contains__(self, unique_id: str) -> bool:
+        return unique_id in self.offsets_by_id
+
+    def iter_instances(self, fields: Optional[List[str]] = None) -> Iterator[dict]:
+        """
+        The instances in the order of the file
+
+        Parameters
+        ----------
+        fields: List of str, optional
+            Keep only these fields of each instance (e.g., ['unique_id', 'response']), by default all of them
+        """
+
+        with open(self.path, 'rb') as f:
+            for line in f:
+                if line.strip():
+                    yield project_instance(json.loads(line), fields)
+
+    def instance(self, unique_id: str, fields: Optional[List[str]] = None) -> dict:
+        """
+        The (first) instance with the unique_id, raises KeyError if there is none
+        """
+
+        if unique_id in self.instances_cache:
+            self.instances_cache.move_to_end(unique_id)
+        else:
+            offset, length = self.offsets_by_id[unique_id]
+            with open(self.path, 'rb') as f:
+                f.seek(offset)
+                self.instances_cache[unique_id] = json.loads(f.read(length))
+            if len(self.instances_cache) > INSTANCES_CACHE_SIZE:
+                self.instances_cache.popitem(last=False)
+
+        return project_instance(self.instances_cache[unique_id], fields)
+
+    def rewrite(self, instances: Iterable[dict]):
+        """
+        Replaces the instances with the given ones, which are streamed to a temporary file next to results.json (on the same filesystem,
+        not the system temp dir) that is read from then on (removed once replaced again or when this object is garbage collected).
+        The instances may be read from this object while rewriting.
+        """
+
+        fd, rewritten_path = tempfile.mkstemp(prefix='.results_', suffix='.json.tmp', dir=os.path.dirname(os.path.abspath(self.path)))
+        remove_rewritten_file = weakref.finalize(self, os.remove, rewritten_path)
+        line_offsets = []
+        offsets_by_id = {}
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for instance in instances:
+                    line = (json.dumps(instance) + "\n").encode('utf-8')
+                    line_offsets.append((f.tell(), len(line)))
+                    offsets_by_id.setdefault(instance['unique_id'], line_offsets[-1])
+                    f.write(line)
+        except BaseException:
+            remove_rewritten_file()
+            raise
+
+        if self._remove_rewritten_file is not None:
+            self._remove_rewritten_file()
+        self.path = rewritten_path
+        self.line_offsets = line_offsets
+        self.offsets_by_id = offsets_by_id
+        self.instances_cache = OrderedDict()
+        self._remove_rewritten_file = remove_rewritten_file
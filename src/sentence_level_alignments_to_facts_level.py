@@ -1,17 +1,19 @@
 import json
 import logging
-import os
+import numpy as np
 import pandas as pd
 from tqdm import tqdm
 
 from src.decontextualize_facts import get_decontextualized_path
 from src.consts import *
 from src.decompose_to_facts import get_facts_path
+from src.intermediate_io import intermediate_exists, parse_offsets, read_intermediate
+from src.span_set import SpanSet
 
        
 
 def change_sent_alignment_based_on_fact(rows, fact_row, is_aligned: bool):
-    alignments_flattened = eval(fact_row['factOffsets'])
+    alignments_flattened = parse_offsets(fact_row['factOffsets'])
     
     # 1. if not aligned, all rows are aligned with the fact
     if not is_aligned:
@@ -19,8 +21,13 @@ def change_sent_alignment_based_on_fact(rows, fact_row, is_aligned: bool):
     # 2. if aligned, per fact, based on its localization in the output, collect all rows that are aligned with the fact
     else: 
         relevant_rows = []
-        for _, row in rows.iterrows():
-            for alignment_span in alignments_flattened:
+        if len(alignments_flattened) > 0:
+            rows_records = rows.to_dict('records')
+            
+            # the start and end of each span of each row
+            row_idxs = []
+            row_spans_endpoints = []
+            for row_idx, row in enumerate(rows_records):
                 if 'scuSpanOffsets' in row:
                     
                     if not isinstance(row['scuSpanOffsets'], list):
@@ -33,16 +40,15 @@ def change_sent_alignment_based_on_fact(rows, fact_row, is_aligned: bool):
                         continue
 
                     row_spans = [[row['scuSentCharIdx'],row['scuSentCharIdx'] + len(row['scuSentence'])]]
-
                 
-                are_intersecting = False
                 for row_span in row_spans:
-                    are_intersecting = (alignment_span[0] <= row_span[0] <= alignment_span[1]) or (alignment_span[0] <= row_span[1] <= alignment_span[1])
-                    if are_intersecting:
-                        relevant_rows.append(row.to_dict())
-                        break
-                if are_intersecting:
-                    break
+                    row_idxs.extend([row_idx, row_idx])
+                    row_spans_endpoints.extend([row_span[0], row_span[1]])
+            
+            # a row is aligned with the fact if the start or the end of any of its spans is inside any of the fact's spans
+            is_endpoint_in_fact = SpanSet.from_spans(alignments_flattened).contains_points(row_spans_endpoints)
+            relevant_row_idxs = sorted(set(np.asarray(row_idxs, dtype=np.int64)[is_endpoint_in_fact].tolist()))
+            relevant_rows = [rows_records[row_idx] for row_idx in relevant_row_idxs]
     
     # 3. merge rows and change that fact is the scuSentence
     relevant_rows = [row for row in relevant_rows if row['documentFile'] is not None]
@@ -94,6 +100,7 @@ def change_alignments_based_on_facts(row, facts_df, is_aligned: bool):
     changed_alignments = [alignment for alignment in changed_alignments if alignment['is_sampled']]    
     
     row['set_of_highlights_in_context'] = changed_alignments
+    return row
 
 
 def save_func(technique_obj, facts_results_path):
@@ -123,14 +130,17 @@ def main(task: str, split: str, results):
             else:
                 raise ValueError(f"Unknown facts method: {facts_method}")
             
-            if not os.path.exists(facts_path):
+            if not intermediate_exists(facts_path):
                 logging.info(f"Facts path {facts_path} does not exist, skipping...")
                 continue
 
-            facts_df = pd.read_csv(facts_path)
-            
+            facts_df = read_intermediate(facts_path)
+            registry = technique_obj['registry']
+            registry.add_facts(facts_method, facts_df)
             
-            for result in tqdm(technique_obj['results']):
-                unique_id = result['unique_id']
-                change_alignments_based_on_facts(result, facts_df[facts_df['unique_id'] == unique_id], is_aligned=technique_obj['config']['aligned'])
+            # the changed results are streamed to a new results file, which the following stages (and facts method) read
+            technique_obj['results'].rewrite(
+                change_alignments_based_on_facts(result, registry.instance_facts(facts_method, result['unique_id']), is_aligned=technique_obj['config']['aligned'])
+                for result in tqdm(technique_obj['results'])
+            )
               
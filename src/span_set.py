@@ -0,0 +1,140 @@
+from typing import Iterable, List, Optional
+import numpy as np
+
+
+class SpanSet:
+    """
+    Set of (start_idx, end_idx) character spans, stored as two integer arrays so the span operations are vectorized.
+    The spans are kept as given until `normalize` (dedup, sort and merge, see `dedup_and_sort_spans`).
+    The queries (`overlaps`, `contains_points`) treat the spans as closed ranges, both ends included.
+
+    Parameters
+    ----------
+    starts, ends: array-like of int
+        The start and end indices of the spans
+    """
+
+    def __init__(self, starts, ends):
+        self.starts = np.asarray(starts, dtype=np.int64)
+        self.ends = np.asarray(ends, dtype=np.int64)
+
+    @classmethod
+    def from_spans(cls, spans: Iterable[Optional[tuple]]) -> 'SpanSet':
+        """
+        From a list of (start_idx, end_idx) spans, None spans are skipped
+        """
+
+        spans = [span for span in spans if span is not None]
+        if len(spans) == 0:
+            return cls([], [])
+
+        spans = np.asarray(spans, dtype=np.int64).reshape(-1, 2)
+        return cls(spans[:, 0], spans[:, 1])
+
+    def to_spans(self) -> List[tuple]:
+        return list(zip(self.starts.tolist(), self.ends.tolist()))
+
+    def to_bytes(self) -> bytes:
+        return np.stack([self.starts, self.ends], axis=1).astype('<i8').tobytes()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'SpanSet':
+        spans = np.frombuffer(data, dtype='<i8').reshape(-1, 2)
+        return cls(spans[:, 0], spans[:, 1])
+
+    def __len__(self):
+        return len(self.starts)
+
+    def normalize(self) -> 'SpanSet':
+        """
+        Deduplicate, sort by (start_idx, end_idx), and merge each span with the previous one if it starts at most one character after
+        the previous ones end (+1 to take into consideration the space between words).
+
+        Returns
+        -------
+        SpanSet
+            Sorted and non-overlapping spans, same as `dedup_and_sort_spans`
+        """
+
+        if len(self) == 0:
+            return self
+
+        spans = np.unique(np.stack([self.starts, self.ends], axis=1), axis=0)  # dedup and sort
+        starts = spans[:, 0]
+        ends = spans[:, 1]
+
+        # a span starts a new merged span if it starts after the end of all the previous spans (+1 for space)
+        prev_max_ends = np.maximum.accumulate(ends)[:-1]
+        is_new_span = np.concatenate([[True], starts[1:] > prev_max_ends + 1])
+        new_span_idxs = np.flatnonzero(is_new_span)
+        return SpanSet(starts[new_span_idxs], np.maximum.reduceat(ends, new_span_idxs))
+
+    def union(self, other: 'SpanSet') -> 'SpanSet':
+        return SpanSet(np.concatenate([self.starts, other.starts]), np.concatenate([self.ends, other.ends])).normalize()
+
+    def intersection(self, other: 'SpanSet') -> 'SpanSet':
+        """
+        The parts that are covered by both span sets (assumes start_idx <= end_idx)
+        """
+
+        spans1 = self._disjoint()
+        spans2 = other._disjoint()
+
+        # for each span of spans1, the range of spans of spans2 it overlaps with (both are sorted and disjoint)
+        first_idxs = np.searchsorted(spans2.ends, spans1.starts, side='left')
+        last_idxs = np.searchsorted(spans2.starts, spans1.ends, side='right')
+        num_overlapping = np.maximum(last_idxs - first_idxs, 0)
+
+        idxs1 = np.repeat(np.arange(len(spans1)), num_overlapping)
+        idxs_in_range = np.arange(num_overlapping.sum()) - np.repeat(np.cumsum(num_overlapping) - num_overlapping, num_overlapping)
+        idxs2 = np.repeat(first_idxs, num_overlapping) + idxs_in_range
+        return SpanSet(np.maximum(spans1.starts[idxs1], spans2.starts[idxs2]), np.minimum(spans1.ends[idxs1], spans2.ends[idxs2]))
+
+    def overlaps(self, other: 'SpanSet') -> np.ndarray:
+        """
+        Batch query, whether each span of other overlaps with any of the spans (assumes start_idx <= end_idx)
+        """
+
+        spans = self._disjoint()
+        if len(spans) == 0:
+            return np.zeros(len(other), dtype=bool)
+
+        # the first span that ends at or after the start of each span of other
+        first_idxs = np.searchsorted(spans.ends, other.starts, side='left')
+        is_found = first_idxs < len(spans)
+        return is_found & (spans.starts[np.where(is_found, first_idxs, 0)] <= other.ends)
+
+    def any_overlap(self, other: 'SpanSet') -> bool:
+        return bool(self.overlaps(other).any())
+
+    def contains_points(self, points) -> np.ndarray:
+        """
+        Batch query, whether each point is inside any of the spans (NaN points are not)
+        """
+
+        points = np.asarray(points, dtype=np.float64)
+        if len(self) == 0:
+            return np.zeros(len(points), dtype=bool)
+
+        order = np.argsort(self.starts, kind='stable')
+        starts = self.starts[order]
+        max_ends = np.maximum.accumulate(self.ends[order])
+
+        # the last span that starts before the point, the point is inside a span iff it is before the furthest end up to it
+        span_idxs = np.searchsorted(starts, points, side='right') - 1
+        return (span_idxs >= 0) & (max_ends[np.maximum(span_idxs, 0)] >= points)
+
+    def _disjoint(self) -> 'SpanSet':
+        """
+        The spans merged only where they overlap (closed ranges), sorted
+        """
+
+        if len(self) == 0:
+            return self
+
+        order = np.lexsort((self.ends, self.starts))
+        starts = self.starts[order]
+        ends = self.ends[order]
+        prev_max_ends = np.maximum.accumulate(ends)[:-1]
+        new_span_idxs = np.flatnonzero(np.concatenate([[True], starts[1:] > prev_max_ends]))
+        return SpanSet(starts[new_span_idxs], np.maximum.reduceat(ends, new_span_idxs))
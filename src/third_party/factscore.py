@@ -1,3 +1,4 @@
+from src.consts import FACTS_IDENTIFIER
 from src.inference.factory import Factory
 from src.inference.utils import retry_wrapper
 
@@ -80,7 +81,7 @@ class FActScoreDecomposition:
     """
     
     def __init__(self, args):
-        self.factory = Factory(args)
+        self.factory = Factory(args, stage=FACTS_IDENTIFIER)
 
 
     def build_prompt(self, datapoint):
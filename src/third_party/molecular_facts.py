@@ -1,3 +1,8 @@
+import logging
+import re
+from typing import List, Optional, Tuple
+
+from src.consts import DECONTEXTUALIZED_FACTS_IDENTIFIER
 from src.inference.factory import Factory
 from src.inference.utils import retry_wrapper
 
@@ -67,6 +72,64 @@ It should retain the same structural format as the original CLAIM."
 """
 
 MOLECULAR_OUTPUT_PREFIX_STR = "##DECONTEXTUALIZED CLAIM##:"
+MOLECULAR_EXPLANATION_PREFIX_STR = "##EXPLANATION##:"
+
+# same criteria and examples, for all the claims of one context at once, the answer of each claim is numbered
+MOLECULAR_MULTI_CLAIM_PROMPT = MOLECULAR_STAGE2_PROMPT_MODIFIED.split("Now generate an EXPLANATION")[0] + """Now generate an EXPLANATION and DECONTEXTUALIZED CLAIM for each of the following numbered CLAIMS, which all share the same CONTEXT. Ensure each DECONTEXTUALIZED CLAIM adds minimal information to resolve ambiguity, such as adjusting pronouns or including clarifying details about the SUBJECT. Each DECONTEXTUALIZED CLAIM should be coherent and must avoid repetition. It should retain the same structural format as its original CLAIM.
+Answer every CLAIM separately and in order, in exactly the following format:
+##CLAIM <number>##
+##EXPLANATION##: <the explanation of the CLAIM>
+##DECONTEXTUALIZED CLAIM##: <the decontextualized CLAIM>
+
+##CONTEXT##: [context]
+[claims]
+"""
+
+# the maximum number of claims sent together in a multi-claim prompt
+MOLECULAR_MAX_CLAIMS_PER_PROMPT = 10
+
+logger = logging.getLogger(__name__)
+
+
+def strip_markdown(text: str) -> str:
+    return text.strip().strip('*`').strip()
+
+
+def parse_multi_claim_response(text: str, num_claims: int) -> List[Optional[Tuple[str, str]]]:
+    """
+    Parses the numbered answers of a multi-claim prompt (see `MOLECULAR_MULTI_CLAIM_PROMPT`).
+    Markdown bold is ignored (e.g., `**##CLAIM 1##**`), the claim echoed after `##CLAIM n##:` is skipped, and the decontextualized claim
+    is only the first non-empty line after `##DECONTEXTUALIZED CLAIM##:` (text the LLM adds after it is dropped).
+
+    Returns
+    -------
+    list of (explanation, disambig_decontext), one per claim, None for a claim whose answer is missing, repeated or malformed
+    (including a decontextualized claim that contains another `##` marker)
+    """
+
+    answers = [None] * num_claims
+    num_answers = [0] * num_claims
+    sections = re.split(r'##\s*CLAIM\s+(\d+)\s*##:?', text.replace('**', ''))
+    for claim_number, section in zip(sections[1::2], sections[2::2]):
+        claim_idx = int(claim_number) - 1
+        if not 0 <= claim_idx < num_claims:
+            continue
+        num_answers[claim_idx] += 1
+
+        if section.count(MOLECULAR_OUTPUT_PREFIX_STR) != 1:
+            continue
+        explanation, disambig_decontext = section.split(MOLECULAR_OUTPUT_PREFIX_STR)
+        if MOLECULAR_EXPLANATION_PREFIX_STR in explanation:
+            explanation = explanation.split(MOLECULAR_EXPLANATION_PREFIX_STR, 1)[1]
+        explanation = strip_markdown(explanation)
+
+        disambig_decontext_lines = [strip_markdown(line) for line in disambig_decontext.splitlines() if strip_markdown(line) != '']
+        if len(disambig_decontext_lines) == 0 or '##' in disambig_decontext_lines[0]:
+            continue
+        answers[claim_idx] = (explanation, disambig_decontext_lines[0])
+
+    return [answer if num_answers[claim_idx] == 1 else None for claim_idx, answer in enumerate(answers)]
+
 
 class MolecularFactsDecontextualization:
     """
@@ -74,7 +137,7 @@ class MolecularFactsDecontextualization:
     """
     
     def __init__(self, args):
-        self.factory = Factory(args)
+        self.factory = Factory(args, stage=DECONTEXTUALIZED_FACTS_IDENTIFIER)
     
     def build_prompt(self, datapoint):
         prompt = MOLECULAR_STAGE2_PROMPT_MODIFIED
@@ -90,9 +153,47 @@ class MolecularFactsDecontextualization:
         inference_wrapper = self.factory.inference_wrapper()
         prompt = self.build_prompt(datapoint)
 
-        response = inference_wrapper.generate_text(messages=[{"role": "user", "content": prompt}])
+        def parse_response(response):
+            explanation, disambig_decontext = [x.strip() for x in response['text'].split(MOLECULAR_OUTPUT_PREFIX_STR)]
+            return explanation, disambig_decontext, response
+
+        # parsed before caching, so a malformed response is generated again on retry
+        return inference_wrapper.generate_text(messages=[{"role": "user", "content": prompt}], parse=parse_response)
+
+    def build_multi_claim_prompt(self, datapoints):
+        prompt = MOLECULAR_MULTI_CLAIM_PROMPT
+        
+        claims = '\n'.join([f"##CLAIM {claim_idx + 1}##: {datapoint['fact_offsets_concatenated']}" for claim_idx, datapoint in enumerate(datapoints)])
+        prompt = prompt.replace('[context]', datapoints[0]['context'].replace('\n', '')).replace('[claims]', claims)
+
+        return prompt
+
+    @retry_wrapper
+    def generate_multi_claim(self, datapoints):
+        inference_wrapper = self.factory.inference_wrapper()
+        prompt = self.build_multi_claim_prompt(datapoints)
+
+        return inference_wrapper.generate_text(messages=[{"role": "user", "content": prompt}])
+
+    def decontextualize_claims(self, datapoints):
+        """
+        Decontextualizes claims that share the same context with a single prompt (a single claim uses the original prompt).
+        Claims whose answer fails to parse are decontextualized again, each with its own prompt.
+        
+        Returns
+        -------
+        list of (explanation, disambig_decontext, response), one per datapoint (same as `decontextualize`)
+        """
+        
+        if len(datapoints) == 1:
+            return [self.decontextualize(datapoints[0])]
+        
+        response = self.generate_multi_claim(datapoints)
+        answers = parse_multi_claim_response(response['text'], len(datapoints))
         
-        explanation, disambig_decontext = [x.strip() for x in response['text'].split(MOLECULAR_OUTPUT_PREFIX_STR)]
+        num_failed = sum(answer is None for answer in answers)
+        if num_failed > 0:
+            logger.warning(f"Failed to parse {num_failed} of {len(datapoints)} claims of a multi-claim response, decontextualizing them one by one")
         
-        return explanation, disambig_decontext, response
+        return [(*answer, response) if answer is not None else self.decontextualize(datapoint) for datapoint, answer in zip(datapoints, answers)]
     
\ No newline at end of file
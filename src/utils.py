@@ -1,4 +1,5 @@
 
+import bisect
 import json
 import logging
 import os
@@ -6,6 +7,8 @@ from typing import List
 import pandas as pd
 
 from src.consts import LFQA_DATASET, MDS_DATASET, TASK_TO_DATASET
+from src.results_file import ResultsFile
+from src.span_set import SpanSet
 
 
 
@@ -14,10 +17,9 @@ def load_results_files(split: str, task: str, techniques: List[str]) -> dict:
     for technique in techniques:
         path = f"results/{split}/{task}/{technique}/results.json"
         assert os.path.exists(path), f"File {path} does not exist"
-        with open(path) as f:
-            results[technique] = {
-                "results": [json.loads(line) for line in f.readlines()]
-            }
+        results[technique] = {
+            "results": ResultsFile(path)
+        }
 
         with open(f"results/{split}/{task}/{technique}/config.json") as f:
             file_config = json.loads(f.read())
@@ -29,8 +31,42 @@ def load_results_files(split: str, task: str, techniques: List[str]) -> dict:
         documents = load_dataset(dataset, split=split)
         results[technique]['documents'] = documents
 
+        results[technique]['registry'] = InstanceRegistry(results[technique]['results'], documents)
+
     return results
 
+
+class InstanceRegistry:
+    """
+    The instances of a technique indexed by their unique_id, with their documents and facts, so the pipeline stages look them up in O(1)
+    instead of scanning all the instances (or facts) per fact.
+    The instances are read from the results file by their byte offset (see `ResultsFile`), the first instance of a repeated unique_id.
+    The facts are added by the stages that read them (`add_facts`), per facts method (e.g., "factscore", "molecular").
+    """
+
+    def __init__(self, results_file: ResultsFile, documents: dict):
+        self.results_file = results_file
+        self.documents = documents
+        self.facts_by_method = {}
+
+    def instance(self, unique_id: str) -> dict:
+        return self.results_file.instance(unique_id)
+
+    def instance_documents(self, unique_id: str) -> dict:
+        return self.documents[unique_id]
+
+    def add_facts(self, facts_method: str, facts_df: pd.DataFrame):
+        facts_by_id = {unique_id: instance_facts_df for unique_id, instance_facts_df in facts_df.groupby('unique_id', sort=False)}
+        self.facts_by_method[facts_method] = (facts_by_id, facts_df.iloc[:0])
+
+    def instance_facts(self, facts_method: str, unique_id: str) -> pd.DataFrame:
+        """
+        The facts of the instance (same rows and index as filtering the facts by unique_id, empty if it has none)
+        """
+
+        facts_by_id, no_facts_df = self.facts_by_method[facts_method]
+        return facts_by_id.get(unique_id, no_facts_df)
+
 def dedup_and_sort_spans(span_list: List[tuple]) -> List[tuple]:
     """
     Deduplicate, sort, and merge overlapping spans
@@ -43,37 +79,74 @@ def dedup_and_sort_spans(span_list: List[tuple]) -> List[tuple]:
     Returns
     -------
     List of tuples
-        Deduplicated, sorted, and merged list of (start_idx, end_idx) tuples
+        Deduplicated, sorted, and merged list of (start_idx, end_idx) tuples (see `SpanSet.normalize`)
     """
 
-        
-    # dedup
-    deduped = []
-    seen = set()
-    for span_obj in span_list:
-        if span_obj is not None and span_obj not in seen:
-            seen.add(span_obj)
-            deduped.append(span_obj)
-
-    # sort
-    deduped_and_sorted = sorted(deduped, key=lambda span_obj: (span_obj[0], span_obj[1]))
-    
-    # merge overlapping spans
-    spans_objs = []
-    for span_obj in deduped_and_sorted:
-        span = span_obj
-        if not spans_objs:
-            spans_objs.append(span_obj)
-        else:
-            is_intersecting_with_last = spans_objs[-1][1] + 1 >= span[0]  # +1 to take into consideration space
-            if is_intersecting_with_last:
-                new_span = (spans_objs[-1][0], max(spans_objs[-1][1], span[1]))
-                spans_objs[-1] = tuple(new_span)
-            else:
-                spans_objs.append(span_obj)
-    
-    return spans_objs
+    return SpanSet.from_spans(span_list).normalize().to_spans()
+
+
+class OffsetMapper:
+    """
+    Maps offsets in the concatenation of a source's spans (joined with a space) to offsets in the entire source, an offset that crosses
+    the end of a span is split between the spans (same output as `fix_local_offset_to_doc_offset`, see its examples).
+    Built once per source, the local end of each span (cumulative lengths) is indexed, so the span of an offset is found with a binary search
+    instead of walking all the spans.
+
+    Parameters
+    ----------
+    doc_span_offsets: List of tuples
+        The (start_idx, end_idx) of the spans in the source
+    """
 
+    def __init__(self, doc_span_offsets: List[tuple]):
+        # plain ints, so the mapped offsets are written as "(0, 5)" in the CSVs (and not "(np.int64(0), np.int64(5))")
+        self.doc_span_offsets = [(int(doc_span_offset[0]), int(doc_span_offset[1])) for doc_span_offset in doc_span_offsets]
+
+        # the start of each span in the concatenation, and the running max of the span ends in it (non-decreasing, to binary search)
+        self.diffs = []
+        self.max_local_ends = []
+        diff = 0
+        for doc_span_offset in self.doc_span_offsets:
+            local_end = diff + doc_span_offset[1] - doc_span_offset[0]
+            self.diffs.append(diff)
+            self.max_local_ends.append(local_end if len(self.max_local_ends) == 0 else max(self.max_local_ends[-1], local_end))
+            diff += doc_span_offset[1] - doc_span_offset[0] + 1  # + 1 for space between spans
+
+    def map(self, offset: tuple) -> List[tuple]:
+        """
+        Returns
+        -------
+        List of tuples
+            The (start_idx, end_idx) of the offset in the source, more than one if the offset crosses spans
+        """
+
+        new_offsets = []
+
+        # the first span whose local end is after the offset's start
+        span_idx = bisect.bisect_right(self.max_local_ends, offset[0])
+        while span_idx < len(self.doc_span_offsets):
+            doc_span_offset = self.doc_span_offsets[span_idx]
+            diff = self.diffs[span_idx]
+            if offset[0] + doc_span_offset[0] - diff < doc_span_offset[1]:
+                new_offset = (doc_span_offset[0] - diff + offset[0], doc_span_offset[0] - diff + offset[1])
+                is_overflowing = new_offset[1] > doc_span_offset[1]
+                if not is_overflowing:
+                    new_offsets.append(new_offset)
+                    return new_offsets
+
+                # continue with the rest of the offset in the next span
+                new_offset = (new_offset[0], doc_span_offset[1])
+                new_offsets.append(new_offset)
+                offset = (offset[0] + new_offset[1] - new_offset[0], offset[1])
+            span_idx += 1
+        raise ValueError(f"offset {offset} not found in {self.doc_span_offsets}")
+
+    def map_all(self, offsets: List[tuple]) -> List[tuple]:
+        """
+        The mapped offsets of all the offsets, flattened
+        """
+
+        return [new_offset for offset in offsets for new_offset in self.map(offset)]
 
 
 def load_dataset(dataset: str, split: str):
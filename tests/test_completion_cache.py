@@ -0,0 +1,55 @@
+import pytest
+
+from src.consts import LLM_CACHE_READ_WRITE_MODE
+from src.inference.completion_cache import CompletionCache, completion_cache_key
+from src.inference.utils import retry_wrapper
+
+
+MESSAGES = [{"role": "user", "content": "prompt"}]
+GENERATION_PARAMS = {"max_tokens": 10}
+
+
+def parse_response(response):
+    if response['text'] == 'malformed':
+        raise ValueError("Failed to parse")
+    return response['text'].upper()
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return CompletionCache(str(tmp_path / "cache.sqlite"), mode=LLM_CACHE_READ_WRITE_MODE)
+
+
+def test_retry_after_parse_failure_generates_again(cache):
+    responses = iter([{"text": "malformed"}, {"text": "valid"}])
+    num_generated = []
+
+    def generate():
+        num_generated.append(1)
+        return next(responses)
+
+    @retry_wrapper
+    def generate_and_parse():
+        return cache.get_or_generate("stage", "model", MESSAGES, GENERATION_PARAMS, generate, parse=parse_response)
+
+    assert generate_and_parse() == "VALID"
+    assert len(num_generated) == 2
+    assert cache.get(completion_cache_key("model", MESSAGES, GENERATION_PARAMS)) == {"text": "valid"}
+
+    # the valid completion is reused
+    assert generate_and_parse() == "VALID"
+    assert len(num_generated) == 2
+    assert cache.stats() == {"stage": {"hits": 1, "misses": 2}}
+
+
+def test_cached_completion_that_fails_to_parse_is_replaced(cache):
+    key = completion_cache_key("model", MESSAGES, GENERATION_PARAMS)
+    cache.put(key, "model", {"text": "malformed"})
+
+    assert cache.get_or_generate("stage", "model", MESSAGES, GENERATION_PARAMS, lambda: {"text": "valid"}, parse=parse_response) == "VALID"
+    assert cache.get(key) == {"text": "valid"}
+
+
+def test_without_parse_returns_the_completion(cache):
+    assert cache.get_or_generate("stage", "model", MESSAGES, GENERATION_PARAMS, lambda: {"text": "a"}) == {"text": "a"}
+    assert cache.get_or_generate("stage", "model", MESSAGES, GENERATION_PARAMS, lambda: {"text": "b"}) == {"text": "a"}
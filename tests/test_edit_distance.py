@@ -0,0 +1,49 @@
+import random
+
+import pytest
+
+from src.consts import ALIGNMENT_ENGINES, BIT_PARALLEL_ALIGNMENT_ENGINE, NUMPY_ALIGNMENT_ENGINE
+from src.lexical_alignment.edit_distance_utils import edit_distance, edit_distance_with_backpointers
+from src.lexical_alignment.lexical_edit_distance_attribution import EDIT_DISTANCE_ENGINES
+from src.lexical_alignment.vectorized_edit_distance import Vocabulary
+
+
+VOCABULARY = ["the", "island", "is", "an", "uninhabited", "volcano", "ash", "rock", "."]
+
+
+def get_random_pairs(num_pairs: int = 300, max_len: int = 12):
+    rng = random.Random(0)
+    return [([rng.choice(VOCABULARY) for _ in range(rng.randrange(max_len))], [rng.choice(VOCABULARY) for _ in range(rng.randrange(max_len))]) for _ in range(num_pairs)]
+
+
+@pytest.mark.parametrize("transpositions", [False, True])
+def test_backpointers_same_as_original(transpositions):
+    for s1, s2 in get_random_pairs():
+        assert edit_distance_with_backpointers(s1, s2, transpositions=transpositions) == edit_distance(s1, s2, transpositions=transpositions)
+
+
+@pytest.mark.parametrize("engine", ALIGNMENT_ENGINES)
+def test_engines_same_as_original(engine):
+    edit_distance_func = EDIT_DISTANCE_ENGINES[engine]
+    for s1, s2 in get_random_pairs():
+        assert edit_distance_func(s1, s2) == edit_distance(s1, s2)
+
+
+@pytest.mark.parametrize("engine", ALIGNMENT_ENGINES)
+def test_engines_on_long_sequences(engine):
+    # longer than a machine word, so the bit-parallel engine spans several blocks
+    edit_distance_func = EDIT_DISTANCE_ENGINES[engine]
+    for s1, s2 in get_random_pairs(num_pairs=5, max_len=150):
+        assert edit_distance_func(s1, s2) == edit_distance(s1, s2)
+
+
+def test_shared_vocabulary():
+    vocabulary = Vocabulary()
+    for s1, s2 in get_random_pairs(num_pairs=20):
+        for engine in [NUMPY_ALIGNMENT_ENGINE, BIT_PARALLEL_ALIGNMENT_ENGINE]:
+            assert EDIT_DISTANCE_ENGINES[engine](s1, s2, vocabulary=vocabulary) == edit_distance(s1, s2)
+
+
+def test_strings():
+    assert edit_distance_with_backpointers("rain", "shine") == edit_distance("rain", "shine")
+    assert edit_distance_with_backpointers("rain", "shine")[0] == 3
@@ -0,0 +1,80 @@
+import glob
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.consts import CSV_INTERMEDIATE_FORMAT, PARQUET_INTERMEDIATE_FORMAT
+from src.intermediate_io import OFFSETS_COLUMNS, parse_offsets, read_intermediate, write_intermediate
+from src.utils import OffsetMapper
+
+
+def get_facts_df():
+    # the offsets as the pipeline builds them, numpy ints included
+    return pd.DataFrame({
+        "unique_id": ["test0", "test1", "test2"],
+        "local_factOffsets": [[(np.int64(0), np.int64(5))], [(0, 3), (4, 9)], []],
+        "factOffsets": [OffsetMapper([(np.int64(10), np.int64(20))]).map_all([(0, 5)]), [(np.int64(3), 5)], None],
+    })
+
+
+def test_parse_offsets():
+    assert parse_offsets("[(0, 62)]") == [(0, 62)]
+    assert parse_offsets("[(0, 5), (7, 9)]") == [(0, 5), (7, 9)]
+    assert parse_offsets([np.array([0, 5]), np.array([7, 9])]) == [(0, 5), (7, 9)]
+    assert parse_offsets(None) is None
+    assert np.isnan(parse_offsets(np.nan))
+    with pytest.raises(ValueError):
+        parse_offsets("[(__import__('os').getcwd(), 1)]")
+
+
+def test_parse_offsets_same_as_eval():
+    # the original reading of the offsets columns, on the bundled results
+    num_compared = 0
+    for csv_path in glob.glob(os.path.join(os.path.dirname(__file__), "..", "results", "*", "*", "*", "*.csv")):
+        df = pd.read_csv(csv_path)
+        for column in OFFSETS_COLUMNS:
+            if column not in df.columns:
+                continue
+            for offsets in df[column].dropna():
+                assert parse_offsets(offsets) == eval(offsets)
+                num_compared += 1
+    assert num_compared > 0
+
+
+def test_offset_mapper_returns_plain_ints():
+    new_offsets = OffsetMapper([(np.int64(0), np.int64(10))]).map((0, 5))
+    assert new_offsets == [(0, 5)]
+    assert all(type(idx) is int for new_offset in new_offsets for idx in new_offset)
+
+
+@pytest.mark.parametrize("intermediate_format", [CSV_INTERMEDIATE_FORMAT, PARQUET_INTERMEDIATE_FORMAT])
+def test_round_trip(tmp_path, intermediate_format):
+    csv_path = str(tmp_path / "factscore.csv")
+    facts_df = get_facts_df()
+    write_intermediate(facts_df, csv_path, intermediate_format)
+
+    read_df = read_intermediate(csv_path)
+    assert read_df['unique_id'].tolist() == facts_df['unique_id'].tolist()
+    assert [parse_offsets(offsets) for offsets in read_df['local_factOffsets']] == [[(0, 5)], [(0, 3), (4, 9)], []]
+    assert [parse_offsets(offsets) for offsets in read_df['factOffsets'][:2]] == [[(10, 15)], [(3, 5)]]
+    assert pd.isna(read_df['factOffsets'][2]) or read_df['factOffsets'][2] is None
+
+
+def test_csv_offsets_are_plain_ints(tmp_path):
+    csv_path = str(tmp_path / "factscore.csv")
+    write_intermediate(get_facts_df(), csv_path, CSV_INTERMEDIATE_FORMAT)
+
+    assert pd.read_csv(csv_path)['local_factOffsets'][0] == "[(0, 5)]"
+
+
+def test_parquet_nested_column_with_missing_values(tmp_path):
+    # as concatenating a LAQuer error-fallback frame (with the source scuSpanOffsets) with parsed frames that don't have the column
+    csv_path = str(tmp_path / "laquer_results.csv")
+    df = pd.concat([pd.DataFrame({"unique_id": ["test0"], "scuSpanOffsets": [[[0, 5]]]}), pd.DataFrame({"unique_id": ["test1"]})], ignore_index=True)
+    write_intermediate(df, csv_path, PARQUET_INTERMEDIATE_FORMAT)
+
+    read_df = read_intermediate(csv_path)
+    assert read_df['scuSpanOffsets'][0] == "[[0, 5]]"
+    assert pd.isna(read_df['scuSpanOffsets'][1])
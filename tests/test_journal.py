@@ -0,0 +1,61 @@
+import os
+
+import pandas as pd
+
+from src.inference.utils import run_concurrently
+from src.journal import Journal, content_key, get_journal_path
+
+
+def test_get_journal_path():
+    assert get_journal_path("results/test/MDS/E2E/molecular.csv") == "results/test/MDS/E2E/molecular.journal"
+
+
+def test_append_and_load(tmp_path):
+    journal = Journal(str(tmp_path / "stage.journal"))
+    assert journal.load() == {}
+
+    journal.append("a", ("explanation", "decontext", {"text": "response"}))
+    journal.append("b", pd.DataFrame({"fact": ["x", "y"]}))
+
+    results = journal.load()
+    assert results["a"] == ("explanation", "decontext", {"text": "response"})
+    assert results["b"].equals(pd.DataFrame({"fact": ["x", "y"]}))
+
+    journal.remove()
+    assert not os.path.exists(journal.path)
+
+
+def test_partially_written_record_is_dropped(tmp_path):
+    journal = Journal(str(tmp_path / "stage.journal"))
+    journal.append("a", 1)
+    journal.append("b", 2)
+    with open(journal.path, 'r+b') as f:
+        f.truncate(os.path.getsize(journal.path) - 3)
+
+    assert journal.load() == {"a": 1}
+    journal.append("c", 3)
+    assert journal.load() == {"a": 1, "c": 3}
+
+
+def test_resume_same_as_uninterrupted(tmp_path):
+    items = [{"sentence": f"sentence {idx}"} for idx in range(20)]
+    expected_results = [item['sentence'].upper() for item in items]
+
+    # a first run that stopped after 8 items
+    journal = Journal(str(tmp_path / "stage.journal"))
+    for item in items[:8]:
+        journal.append(content_key(item), item['sentence'].upper())
+
+    processed = []
+
+    def func(item):
+        processed.append(item['sentence'])
+        return item['sentence'].upper()
+
+    called_back = {}
+    results = run_concurrently(func, items, max_concurrency=4, journal=journal, callback=lambda idx, result: called_back.__setitem__(idx, result))
+
+    assert results == expected_results
+    assert called_back == dict(enumerate(expected_results))
+    assert sorted(processed) == sorted(item['sentence'] for item in items[8:])
+    assert len(journal.load()) == len(items)
@@ -0,0 +1,60 @@
+import json
+import os
+
+import pytest
+
+from src.consts import ALIGNMENT_ENGINES, LOOKUP_LEMMA_BACKEND
+from src.lexical_alignment.edit_distance_utils import edit_distance, edit_distance_path, path_to_word_alignments
+from src.lexical_alignment.lemmatization import get_lemmatizer
+from src.lexical_alignment.lexical_edit_distance_attribution import lexical_alignment, lexical_alignment_recursively
+
+from tests.test_edit_distance import get_random_pairs
+
+
+# the outputs of the original implementation by lemmatization mode, see scripts/benchmark_lexical_alignment.py
+REFERENCE_PATH = os.path.join(os.path.dirname(__file__), "..", "results", "test", "lexical_alignment_reference__{mode}.json")
+NO_LEMMATIZATION_MODE = "no_lemmatization"
+MAX_REFERENCE_PAIR_LENGTH = 64
+
+
+def test_word_alignments_same_as_edit_ops():
+    for s1, s2 in get_random_pairs():
+        _, edit_ops = edit_distance(s1, s2)
+
+        # the original decision, the last "no-op" of each word of s1
+        expected_word_alignments = [None] * len(s1)
+        for edit_op in edit_ops:
+            if edit_op['action'] == 'no-op':
+                expected_word_alignments[edit_op['i']] = edit_op['j']
+
+        _, path = edit_distance_path(s1, s2)
+        assert path_to_word_alignments(path, s1, s2) == expected_word_alignments
+
+
+def load_reference_pairs(mode: str):
+    with open(REFERENCE_PATH.format(mode=mode)) as f:
+        reference = json.load(f)
+
+    # the real pairs and the shorter synthetic ones, the longer ones are left for the benchmark
+    pairs = [pair for pair in reference['pairs'] if not pair['source'].startswith('synthetic') or int(pair['source'].rsplit('_', 1)[1]) <= MAX_REFERENCE_PAIR_LENGTH]
+    return pairs, reference['stop_words']
+
+
+@pytest.mark.parametrize("mode", [NO_LEMMATIZATION_MODE, LOOKUP_LEMMA_BACKEND])
+@pytest.mark.parametrize("engine", ALIGNMENT_ENGINES)
+def test_same_as_reference(engine, mode):
+    lemmatizer = None
+    if mode != NO_LEMMATIZATION_MODE:
+        pytest.importorskip("spacy_lookups_data")
+        lemmatizer = get_lemmatizer(backend=mode)
+    should_run_lemmatization = lemmatizer is not None
+
+    pairs, stop_words = load_reference_pairs(mode)
+    assert len(pairs) > 0
+
+    for pair in pairs:
+        alignments = lexical_alignment(pair['sentence'], pair['fact'], should_run_lemmatization=should_run_lemmatization, nlp=lemmatizer, engine=engine)
+        assert json.loads(json.dumps(alignments)) == pair['outputs']['lexical_alignment']
+
+        recursive_alignments = lexical_alignment_recursively(pair['sentence'], pair['fact'], should_run_lemmatization=should_run_lemmatization, nlp=lemmatizer, stop_words=stop_words, engine=engine)
+        assert json.loads(json.dumps(recursive_alignments)) == pair['outputs']['lexical_alignment_recursively']
@@ -0,0 +1,120 @@
+import pytest
+
+pytest.importorskip("litellm")
+
+from src.third_party.molecular_facts import MolecularFactsDecontextualization, parse_multi_claim_response
+
+
+def test_well_formed():
+    text = """##CLAIM 1##
+##EXPLANATION##: 1. The SUBJECT "He" refers to "X".
+##DECONTEXTUALIZED CLAIM##: X is tall.
+
+##CLAIM 2##
+##EXPLANATION##: 1. The SUBJECT "She" refers to "Y".
+2. No disambiguation is necessary.
+##DECONTEXTUALIZED CLAIM##: Y is short."""
+
+    assert parse_multi_claim_response(text, 2) == [
+        ('1. The SUBJECT "He" refers to "X".', "X is tall."),
+        ('1. The SUBJECT "She" refers to "Y".\n2. No disambiguation is necessary.', "Y is short."),
+    ]
+
+
+def test_missing_repeated_and_out_of_range():
+    answer = "##EXPLANATION##: e\n##DECONTEXTUALIZED CLAIM##: {}\n"
+    text = "##CLAIM 1##\n" + answer.format("A.") + "##CLAIM 1##\n" + answer.format("B.") + "##CLAIM 3##\n" + answer.format("C.") + "##CLAIM 4##\n" + answer.format("D.")
+
+    assert parse_multi_claim_response(text, 3) == [None, None, ("e", "C.")]
+
+
+def test_malformed():
+    text = """##CLAIM 1##
+##EXPLANATION##: e
+##CLAIM 2##
+##EXPLANATION##: e
+##DECONTEXTUALIZED CLAIM##:
+##CLAIM 3##
+##EXPLANATION##: e
+##DECONTEXTUALIZED CLAIM##: C. ##EXPLANATION##: e"""
+
+    assert parse_multi_claim_response(text, 3) == [None, None, None]
+
+
+def test_echoed_claim():
+    text = """##CLAIM 1##: He is tall.
+##EXPLANATION##: e
+##DECONTEXTUALIZED CLAIM##: X is tall."""
+
+    assert parse_multi_claim_response(text, 1) == [("e", "X is tall.")]
+
+
+def test_trailing_text():
+    text = """##CLAIM 1##
+##EXPLANATION##: e
+##DECONTEXTUALIZED CLAIM##: X is tall.
+---
+##CLAIM 2##
+##EXPLANATION##: e
+##DECONTEXTUALIZED CLAIM##:
+Y is short.
+
+I hope this helps!"""
+
+    assert parse_multi_claim_response(text, 2) == [("e", "X is tall."), ("e", "Y is short.")]
+
+
+def test_markdown():
+    text = """### **##CLAIM 1##**
+**##EXPLANATION##:** e
+**##DECONTEXTUALIZED CLAIM##:** **A.**
+
+### **##CLAIM 2##**
+##EXPLANATION##: e
+##DECONTEXTUALIZED CLAIM##: `B.`"""
+
+    assert parse_multi_claim_response(text, 2) == [("e", "A."), ("e", "B.")]
+
+
+def get_stub_decontextualization(multi_claim_text: str, calls: list):
+    decontextualization = MolecularFactsDecontextualization.__new__(MolecularFactsDecontextualization)
+
+    def generate_multi_claim(datapoints):
+        calls.append(("multi_claim", len(datapoints)))
+        return {"text": multi_claim_text}
+
+    def decontextualize(datapoint):
+        calls.append(("single_claim", datapoint['fact_offsets_concatenated']))
+        return "single", f"decontextualized {datapoint['fact_offsets_concatenated']}", {"text": "single"}
+
+    decontextualization.generate_multi_claim = generate_multi_claim
+    decontextualization.decontextualize = decontextualize
+    return decontextualization
+
+
+def test_decontextualize_claims_falls_back_to_single_claims():
+    text = """##CLAIM 1##
+##EXPLANATION##: e
+##DECONTEXTUALIZED CLAIM##: A.
+##CLAIM 3##
+##EXPLANATION##: e
+##DECONTEXTUALIZED CLAIM##: C."""
+    datapoints = [{"fact_offsets_concatenated": fact} for fact in ["a", "b", "c"]]
+
+    calls = []
+    results = get_stub_decontextualization(text, calls).decontextualize_claims(datapoints)
+
+    assert results == [
+        ("e", "A.", {"text": text}),
+        ("single", "decontextualized b", {"text": "single"}),
+        ("e", "C.", {"text": text}),
+    ]
+    assert calls == [("multi_claim", 3), ("single_claim", "b")]
+
+
+def test_decontextualize_single_claim():
+    calls = []
+    results = get_stub_decontextualization("", calls).decontextualize_claims([{"fact_offsets_concatenated": "a"}])
+
+    assert results == [("single", "decontextualized a", {"text": "single"})]
+    assert calls == [("single_claim", "a")]
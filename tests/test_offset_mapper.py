@@ -0,0 +1,71 @@
+import random
+
+import pytest
+
+from src.utils import OffsetMapper
+
+
+def original_fix_local_offset_to_doc_offset(offset, doc_span_offsets):
+    """
+    The original implementation of `fix_local_offset_to_doc_offset`, walking all the spans per offset
+    """
+
+    new_offsets = []
+
+    diff = 0
+    for doc_span_offset in doc_span_offsets:
+        doc_span_char_idx = doc_span_offset[0]
+        if offset[0] + doc_span_char_idx - diff < doc_span_offset[1]:
+            new_offset = (doc_span_offset[0] - diff + offset[0], doc_span_offset[0] - diff + offset[1])
+            is_overflowing = new_offset[1] > doc_span_offset[1]
+            if not is_overflowing:
+                new_offsets.append(new_offset)
+                return new_offsets
+            else:
+                new_offset = (new_offset[0], doc_span_offset[1])
+                new_offsets.append(new_offset)
+
+                distance_completed = new_offset[1] - new_offset[0]
+                offset = (offset[0] + distance_completed, offset[1])
+
+        diff += doc_span_offset[1] - doc_span_offset[0] + 1
+    raise ValueError(f"offset {offset} not found in {doc_span_offsets}")
+
+
+def map_or_error(map_func, offset, doc_span_offsets):
+    try:
+        return map_func(offset, doc_span_offsets)
+    except ValueError:
+        return ValueError
+
+
+def test_docstring_examples():
+    assert OffsetMapper([(191, 271)]).map((63, 66)) == [(191 + 63, 191 + 66)]
+    assert OffsetMapper([(100, 200), (300, 400)]).map((120, 140)) == [(300 + 120 - 100 - 1, 300 + 140 - 100 - 1)]
+    assert OffsetMapper([(100, 200), (300, 400)]).map((80, 200)) == original_fix_local_offset_to_doc_offset((80, 200), [(100, 200), (300, 400)])
+
+
+def test_same_as_original():
+    rng = random.Random(0)
+    for _ in range(500):
+        # sorted spans, some of them overlapping or out of order, as the spans of a source can be
+        doc_span_offsets = []
+        start = rng.randrange(50)
+        for _ in range(rng.randrange(1, 6)):
+            length = rng.randrange(1, 40)
+            doc_span_offsets.append((start, start + length))
+            start = max(0, start + length + rng.randrange(-20, 30))
+
+        local_length = sum(end - start + 1 for start, end in doc_span_offsets)
+        offset_mapper = OffsetMapper(doc_span_offsets)
+        for _ in range(10):
+            local_start = rng.randrange(local_length + 5)
+            offset = (local_start, local_start + rng.randrange(1, 30))
+            assert map_or_error(lambda offset, _: offset_mapper.map(offset), offset, doc_span_offsets) == map_or_error(original_fix_local_offset_to_doc_offset, offset, doc_span_offsets)
+
+
+def test_map_all():
+    offset_mapper = OffsetMapper([(100, 200), (300, 400)])
+    assert offset_mapper.map_all([(0, 5), (120, 140)]) == [(100, 105), (319, 339)]
+    with pytest.raises(ValueError):
+        offset_mapper.map((500, 510))
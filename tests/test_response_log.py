@@ -0,0 +1,22 @@
+import json
+
+from src.response_log import ResponseLog, load_response_log
+
+
+def test_large_values_are_stored_once(tmp_path):
+    path = str(tmp_path / "responses.jsonl")
+    context = "a long shared context " * 50
+    with ResponseLog(path) as response_log:
+        # written out of order, as the responses arrive
+        response_log.write(1, {"text": "second", "context": context, "source_spans": {"doc": context}})
+        response_log.write(0, {"text": "first", "context": context, "source_spans": {"doc": context}})
+
+    with open(path) as f:
+        entries = [json.loads(line) for line in f]
+    assert sum('blob' in entry for entry in entries) == 2  # the context, and the source spans
+    assert sum('record' in entry for entry in entries) == 2
+
+    responses = load_response_log(path)
+    assert responses['text'].tolist() == ["first", "second"]
+    assert responses['context'].tolist() == [context, context]
+    assert responses['source_spans'].tolist() == [{"doc": context}, {"doc": context}]
@@ -0,0 +1,69 @@
+import glob
+import json
+import os
+
+import pytest
+
+from src.results_file import ResultsFile
+
+
+RESULTS_PATHS = sorted(glob.glob(os.path.join(os.path.dirname(__file__), "..", "results", "*", "*", "*", "results.json")))
+
+
+def original_load_results(path):
+    """
+    The original reading of results.json in `load_results_files`
+    """
+
+    with open(path) as f:
+        return [json.loads(line) for line in f.readlines()]
+
+
+@pytest.mark.parametrize("path", RESULTS_PATHS)
+def test_same_as_original(path):
+    instances = original_load_results(path)
+    results_file = ResultsFile(path)
+
+    assert len(results_file) == len(instances)
+    assert list(results_file) == instances
+    assert list(results_file.iter_instances(fields=['unique_id', 'response'])) == [{"unique_id": instance['unique_id'], "response": instance['response']} for instance in instances]
+
+    first_instance_by_id = {}
+    for instance in instances:
+        first_instance_by_id.setdefault(instance['unique_id'], instance)
+    for unique_id, instance in first_instance_by_id.items():
+        assert unique_id in results_file
+        assert results_file.instance(unique_id) == instance
+
+
+def test_duplicates_and_missing(tmp_path):
+    path = tmp_path / "results.json"
+    path.write_text('{"unique_id": "a", "response": "first"}\n\n{"unique_id": "b", "response": "b"}\n{"unique_id": "a", "response": "second"}')
+
+    results_file = ResultsFile(str(path))
+    assert len(results_file) == 3
+    assert results_file.instance("a") == {"unique_id": "a", "response": "first"}
+    assert results_file.instance("a", fields=['response']) == {"response": "first"}
+    with pytest.raises(KeyError):
+        results_file.instance("c")
+
+
+def test_rewrite(tmp_path):
+    path = tmp_path / "results.json"
+    path.write_text('{"unique_id": "a", "set_of_highlights_in_context": [1, 2]}\n{"unique_id": "b", "set_of_highlights_in_context": [3]}\n')
+    results_file = ResultsFile(str(path))
+
+    def change(instance):
+        instance['set_of_highlights_in_context'] = instance['set_of_highlights_in_context'][:1]
+        return instance
+
+    results_file.rewrite(change(instance) for instance in results_file)
+    rewritten_path = results_file.path
+    assert os.path.dirname(rewritten_path) == str(tmp_path)
+    assert list(results_file) == [{"unique_id": "a", "set_of_highlights_in_context": [1]}, {"unique_id": "b", "set_of_highlights_in_context": [3]}]
+    assert results_file.instance("b") == {"unique_id": "b", "set_of_highlights_in_context": [3]}
+
+    # the original file is not changed, and the rewritten file is removed once replaced
+    assert path.read_text().startswith('{"unique_id": "a", "set_of_highlights_in_context": [1, 2]}')
+    results_file.rewrite(iter(list(results_file)))
+    assert not os.path.exists(rewritten_path)
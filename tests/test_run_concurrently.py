@@ -0,0 +1,40 @@
+import random
+from time import sleep
+
+import pytest
+
+from src.inference.utils import run_concurrently
+
+
+def slow_square(item):
+    sleep(random.random() / 1000)
+    return item * item
+
+
+@pytest.mark.parametrize("max_concurrency", [1, 4])
+def test_same_as_sequential(max_concurrency):
+    items = list(range(50))
+    called_back = {}
+
+    results = run_concurrently(slow_square, items, max_concurrency=max_concurrency, callback=lambda idx, result: called_back.__setitem__(idx, result))
+
+    assert results == [slow_square(item) for item in items]
+    assert called_back == dict(enumerate(results))
+
+
+def test_without_keeping_results():
+    called_back = {}
+    results = run_concurrently(slow_square, [1, 2, 3], max_concurrency=2, callback=lambda idx, result: called_back.__setitem__(idx, result), keep_results=False)
+
+    assert results == [None, None, None]
+    assert called_back == {0: 1, 1: 4, 2: 9}
+
+
+def test_failure_is_raised():
+    def fail_on_three(item):
+        if item == 3:
+            raise RuntimeError("failed")
+        return item
+
+    with pytest.raises(RuntimeError):
+        run_concurrently(fail_on_three, list(range(10)), max_concurrency=4)
@@ -0,0 +1,99 @@
+import random
+
+import numpy as np
+
+from src.span_set import SpanSet
+from src.utils import dedup_and_sort_spans
+
+
+def original_dedup_and_sort_spans(span_list):
+    """
+    The original implementation of `dedup_and_sort_spans`
+    """
+
+    deduped = []
+    seen = set()
+    for span_obj in span_list:
+        if span_obj is not None and span_obj not in seen:
+            seen.add(span_obj)
+            deduped.append(span_obj)
+
+    deduped_and_sorted = sorted(deduped, key=lambda span_obj: (span_obj[0], span_obj[1]))
+
+    spans_objs = []
+    for span in deduped_and_sorted:
+        if not spans_objs:
+            spans_objs.append(span)
+        elif spans_objs[-1][1] + 1 >= span[0]:
+            spans_objs[-1] = (spans_objs[-1][0], max(spans_objs[-1][1], span[1]))
+        else:
+            spans_objs.append(span)
+
+    return spans_objs
+
+
+def get_random_spans(rng, max_num_spans: int = 8, max_idx: int = 60):
+    spans = []
+    for _ in range(rng.randrange(max_num_spans)):
+        start = rng.randrange(max_idx)
+        spans.append((start, start + rng.randrange(10)))
+    return spans
+
+
+def get_points(spans):
+    """
+    The points covered by the spans, as closed ranges
+    """
+
+    return {point for start, end in spans for point in range(start, end + 1)}
+
+
+def test_normalize_same_as_original():
+    rng = random.Random(0)
+    for _ in range(1000):
+        spans = get_random_spans(rng) + [None] * rng.randrange(2)
+        assert dedup_and_sort_spans(spans) == original_dedup_and_sort_spans(spans)
+
+
+def test_union():
+    rng = random.Random(1)
+    for _ in range(500):
+        spans1 = get_random_spans(rng)
+        spans2 = get_random_spans(rng)
+        assert SpanSet.from_spans(spans1).union(SpanSet.from_spans(spans2)).to_spans() == original_dedup_and_sort_spans(spans1 + spans2)
+
+
+def test_intersection():
+    rng = random.Random(2)
+    for _ in range(500):
+        spans1 = get_random_spans(rng)
+        spans2 = get_random_spans(rng)
+        intersection = SpanSet.from_spans(spans1).intersection(SpanSet.from_spans(spans2)).to_spans()
+        assert all(start <= end for start, end in intersection)
+        assert get_points(intersection) == get_points(spans1) & get_points(spans2)
+
+
+def test_overlaps():
+    rng = random.Random(3)
+    for _ in range(500):
+        spans = get_random_spans(rng)
+        queries = get_random_spans(rng)
+        span_set = SpanSet.from_spans(spans)
+        expected_overlaps = [len(get_points([query]) & get_points(spans)) > 0 for query in queries]
+        assert span_set.overlaps(SpanSet.from_spans(queries)).tolist() == expected_overlaps
+        assert span_set.any_overlap(SpanSet.from_spans(queries)) == any(expected_overlaps)
+
+
+def test_contains_points():
+    rng = random.Random(4)
+    for _ in range(500):
+        spans = get_random_spans(rng)
+        points = [rng.randrange(-5, 75) for _ in range(10)] + [np.nan]
+        expected = [not np.isnan(point) and point in get_points(spans) for point in points]
+        assert SpanSet.from_spans(spans).contains_points(points).tolist() == expected
+
+
+def test_bytes_round_trip():
+    span_set = SpanSet.from_spans([(5, 9), (0, 3), (5, 9)])
+    assert SpanSet.from_bytes(span_set.to_bytes()).to_spans() == [(5, 9), (0, 3), (5, 9)]
+    assert SpanSet.from_bytes(SpanSet.from_spans([]).to_bytes()).to_spans() == []
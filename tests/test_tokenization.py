@@ -0,0 +1,26 @@
+from concurrent.futures import ThreadPoolExecutor
+from nltk.tokenize import NLTKWordTokenizer
+
+from src.lexical_alignment.tokenization import SpanTokenizer
+
+
+def test_same_spans_as_nltk():
+    text = "The island, which is uninhabited, isn't far."
+    span_tokenizer = SpanTokenizer()
+
+    expected_spans = [(text[start:end], (start, end)) for start, end in NLTKWordTokenizer().span_tokenize(text)]
+    assert span_tokenizer.tokenize(text) == expected_spans
+    assert span_tokenizer.tokenize(text) == expected_spans  # cached
+    assert span_tokenizer.stats() == {"hits": 1, "misses": 1, "cache_size": 1}
+
+
+def test_shared_by_threads():
+    span_tokenizer = SpanTokenizer(max_cache_size=8)
+    texts = [f"fact number {idx % 32} is here." for idx in range(5000)]
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        spans = list(executor.map(span_tokenizer.tokenize, texts))
+
+    assert spans == [SpanTokenizer().tokenize(text) for text in texts]
+    assert len(span_tokenizer.cache) <= 8
+    assert span_tokenizer.stats()["hits"] + span_tokenizer.stats()["misses"] == len(texts)